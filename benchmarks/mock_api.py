@@ -0,0 +1,327 @@
+"""
+A local stand-in for the Quanta API, used by the benchmarks to run offline
+
+It keeps sites, organizations, servers, scenarios, Magento endpoints and
+analytics accounts in memory and serves them like the API does, with a
+configurable latency, payload size and error rate.
+
+    with MockQuantaAPI(latency=0.01, items=100) as api:
+        quanta = Quanta(url=api.url)
+
+It can also be run standalone: mock_api.py [--port PORT] [--latency SECONDS] ...
+
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SITE_RE = re.compile(r'^/sites/(\d+)(/.*)?$')
+COLLECTION_RE = re.compile(r'^/(system/servers|websc/scenarios)(?:/(\d+))?$')
+COLLECTIONS = {
+    'system/servers': ('servers', 'server'),
+    'websc/scenarios': ('scenarios', 'scenario'),
+}
+SINGLES = {
+    '/magento/endpoint': 'endpoint',
+    '/analytics/account': 'analytics',
+}
+
+
+def make_server(i):
+    return {
+        'id': i, 'name': 'server{}'.format(i), 'role': 'web', 'host': 'web{}.local'.format(i),
+        'port': 10050, 'enabled': True, 'template': 'passive',
+    }
+
+
+def make_step(i):
+    return {
+        'id': i, 'name': 'step {}'.format(i), 'no': i, 'magento_enabled': False,
+        'url': 'https://shop.example.com/{}'.format(i), 'is_post': False,
+        'expected_code': 200, 'expected_string': None, 'post_data': None,
+        'request_timeout': 20,
+    }
+
+
+def make_scenario(i, steps):
+    return {
+        'id': i, 'name': 'scenario{}'.format(i), 'main': i == 1, 'enabled': True,
+        'magento_string': None, 'user_agent': None, 'cookies': None,
+        'status': 'ok', 'failed_step': None,
+        'steps': [make_step(j) for j in range(1, steps + 1)],
+    }
+
+
+
+class Site(object):
+    """
+    The resources of one site
+
+    """
+
+    def __init__(self, site_id, items, steps):
+        self.id = site_id
+        self.name = 'site{}'.format(site_id)
+        self.lock = threading.Lock()
+        self.servers = {i: make_server(i) for i in range(1, items + 1)}
+        self.scenarios = {i: make_scenario(i, steps) for i in range(1, items + 1)}
+        self.endpoint = {'url': 'https://shop.example.com/quanta', 'enabled': True}
+        self.analytics = {'profile_id': str(site_id), 'enabled': True}
+
+
+    def collection(self, name):
+        return getattr(self, name)
+
+
+    def next_id(self, name):
+        return max(self.collection(name) or [0]) + 1
+
+
+
+class MockQuantaAPI(object):
+    """
+    An in-process Quanta API server
+
+    latency is the delay added to every response in seconds, with up to jitter
+    more seconds at random. items is the number of servers and scenarios of
+    each site, steps the number of steps of each scenario. A ratio error_rate
+    of requests fail with error_status.
+
+    If auth is set, requests must send the CSRF token of a session opened by
+    logging in, otherwise they fail with 401. `expire_sessions` closes every
+    session.
+
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, sites=3, items=10,
+                 steps=5, error_rate=0.0, error_status=503, seed=None, auth=False):
+        self.latency = latency
+        self.jitter = jitter
+        self.items = items
+        self.steps = steps
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.auth = auth
+        self.tokens = set()
+        self.logins = 0
+        self.requests = 0
+        self.errors = 0
+        self.sites = {i: Site(i, items, steps) for i in range(1, sites + 1)}
+        self.organizations = {1: {'id': 1, 'name': 'organization'}}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}/api'.format(host, port)
+
+
+    def start(self):
+        """
+        Serve requests in a background thread
+
+        """
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+    def expire_sessions(self):
+        with self._lock:
+            self.tokens.clear()
+
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, fmt, *args):
+                pass
+
+            def handle_request(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                status, response, headers = api.handle(self.command, self.path, body, self.headers)
+                data = json.dumps(response).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_DELETE = handle_request
+
+        return Handler
+
+
+    def handle(self, method, path, body, headers=None):
+        """
+        Returns the (status, response, headers) answering a request, headers
+        being the request headers
+
+        """
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+            fail = self.error_rate and self.random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return self.error_status, {'error': 'injected error'}, {'Retry-After': '0'}
+        path = path.split('?')[0]
+        if path.startswith('/api'):
+            path = path[len('/api'):]
+        if path in ('/users/login.json', '/users/login'):
+            return self._login(method)
+        if self.auth and (headers or {}).get('X-CSRF-Token') not in self.tokens:
+            return 401, {'error': 'You need to sign in before continuing.'}, {}
+        if path == '/sites':
+            if method == 'POST':
+                return 200, {'site': self._create_site((body or {}).get('site', {}))}, {}
+            return 200, {'sites': [{'id': i, 'name': site.name} for i, site in self.sites.items()]}, {}
+        if path == '/organizations':
+            if method == 'POST':
+                with self._lock:
+                    org = dict((body or {}).get('organization', {}), id=max(self.organizations) + 1)
+                    org.pop('sites_attributes', None)
+                    self.organizations[org['id']] = org
+                return 200, {'organization': dict(org, sites=[])}, {}
+            sites = [{'id': i, 'name': site.name} for i, site in self.sites.items()]
+            organizations = [dict(org, sites=sites if id == 1 else []) for id, org in self.organizations.items()]
+            return 200, {'organizations': organizations}, {}
+        match = SITE_RE.match(path)
+        site = self.sites.get(int(match.group(1))) if match else None
+        if site is None:
+            return 404, {'error': 'Not found'}, {}
+        with site.lock:
+            return self._handle_site(site, method, match.group(2) or '', body)
+
+
+    def _create_site(self, data):
+        with self._lock:
+            site = Site(max(self.sites) + 1, 0, self.steps)
+            site.name = data.get('name', 'site{}'.format(site.id))
+            self.sites[site.id] = site
+        return {'id': site.id, 'name': site.name}
+
+
+    def _login(self, method):
+        if method != 'POST':
+            return 200, {'csrf_token': 'mock-token'}, {}
+        with self._lock:
+            self.logins += 1
+            token = 'mock-token-{}'.format(self.logins)
+            self.tokens.add(token)
+        return 200, {'csrf_token': token}, {'Set-Cookie': '_session={}; Path=/'.format(self.logins)}
+
+
+    def _handle_site(self, site, method, path, body):
+        if path == '':
+            return 200, {'site': {'id': site.id, 'name': site.name}}, {}
+        if path in SINGLES:
+            key = SINGLES[path]
+            if method == 'PUT':
+                getattr(site, key).update((body or {}).get(key, {}))
+            return 200, {key: getattr(site, key)}, {}
+        match = COLLECTION_RE.match(path)
+        if match is None:
+            return 404, {'error': 'Not found'}, {}
+        plural, key = COLLECTIONS[match.group(1)]
+        collection = site.collection(plural)
+        if match.group(2) is None:
+            if method == 'POST':
+                obj = self._save({'id': site.next_id(plural)}, (body or {}).get(key, {}))
+                collection[obj['id']] = obj
+                return 200, {key: obj}, {}
+            return 200, {plural: list(collection.values())}, {}
+        obj = collection.get(int(match.group(2)))
+        if obj is None:
+            return 404, {'error': 'Not found'}, {}
+        if method == 'DELETE':
+            del collection[obj['id']]
+        elif method == 'PUT':
+            self._save(obj, (body or {}).get(key, {}))
+        return 200, {key: obj}, {}
+
+
+    def _save(self, obj, data):
+        """
+        Apply the attributes of data to obj, nested steps being created, updated
+        or destroyed like the API does with steps_attributes
+
+        """
+        steps = data.pop('steps_attributes', None)
+        obj.update(data)
+        if steps is not None:
+            current = {step['id']: step for step in obj.get('steps', [])}
+            next_id = max(current or [0]) + 1
+            for step in steps:
+                if step.get('id') in current:
+                    if step.get('_destroy'):
+                        del current[step['id']]
+                    else:
+                        current[step['id']].update(step)
+                elif not step.get('_destroy'):
+                    current[next_id] = dict(step, id=next_id)
+                    next_id += 1
+            obj['steps'] = [dict((k, v) for k, v in step.items() if k != '_destroy')
+                            for step in current.values()]
+        return obj
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a local stand-in for the Quanta API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--sites', type=int, default=3)
+    parser.add_argument('--items', type=int, default=10)
+    parser.add_argument('--steps', type=int, default=5)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--auth', action='store_true')
+    args = parser.parse_args()
+    api = MockQuantaAPI(args.host, args.port, args.latency, args.jitter, args.sites, args.items,
+                        args.steps, args.error_rate, args.error_status, auth=args.auth)
+    print('Serving the mock Quanta API on {}'.format(api.url))
+    try:
+        api.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
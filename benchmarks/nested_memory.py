@@ -0,0 +1,91 @@
+"""
+Checks that parsing and updating resources with nested objects does not grow
+memory over time
+
+Runs parse/update cycles of a scenario with nested steps against an in-process
+transport and prints the traced memory and the numbers of live resource
+classes and instances every CHECKPOINT cycles.
+
+The check fails if the numbers of classes or instances change after the first
+checkpoint, or if the traced memory grows by more than MAX_GROWTH bytes: the
+baseline is only a few KiB, so a relative bound would mostly measure noise.
+
+Usage: nested_memory.py [cycles]
+
+"""
+import gc
+import sys
+import tracemalloc
+
+from pyquanta import Quanta
+from pyquanta.resources.base import JsonObject
+
+CHECKPOINT = 10000
+MAX_GROWTH = 64 * 1024
+SCENARIO = {
+    'id': 1,
+    'name': 'checkout',
+    'steps': [
+        {'id': i, 'name': 'step {}'.format(i), 'no': i, 'url': 'https://example.com/{}'.format(i)}
+        for i in range(20)
+    ],
+}
+
+
+class LocalQuanta(Quanta):
+    """
+    A Quanta client answering every request with the same scenario
+
+    """
+
+    def _request(self, route, data, method, jsonify=True, verify=True, ttl=None):
+        return {'scenario': SCENARIO}
+
+
+def count_objects():
+    """
+    Returns the numbers of live resource classes and instances
+
+    """
+    gc.collect()
+    classes = instances = 0
+    for obj in gc.get_objects():
+        if isinstance(obj, type):
+            classes += issubclass(obj, JsonObject)
+        elif isinstance(obj, JsonObject):
+            instances += 1
+    return classes, instances
+
+
+def main(cycles):
+    quanta = LocalQuanta()
+    quanta.use_site(1)
+    tracemalloc.start()
+    baseline = None
+    failures = []
+    print('{:>10} {:>14} {:>10} {:>10}'.format('cycles', 'memory (KiB)', 'classes', 'instances'))
+    for i in range(1, cycles + 1):
+        scenario = quanta.scenarios(**SCENARIO)
+        scenario.update()
+        if i % CHECKPOINT == 0:
+            del scenario
+            counts = count_objects()
+            memory = tracemalloc.get_traced_memory()[0]
+            if baseline is None:
+                baseline = memory, counts
+            elif counts != baseline[1]:
+                failures.append('{} classes and {} instances after {} cycles, {} and {} at first'.format(
+                    counts[0], counts[1], i, baseline[1][0], baseline[1][1]))
+            print('{:>10} {:>14.1f} {:>10} {:>10}'.format(i, memory / 1024.0, counts[0], counts[1]))
+    growth = memory - baseline[0]
+    print('Memory growth after the first checkpoint: {:.1f} KiB'.format(growth / 1024.0))
+    if growth > MAX_GROWTH:
+        failures.append('memory grew by {:.1f} KiB, more than {:.0f} KiB'.format(
+            growth / 1024.0, MAX_GROWTH / 1024.0))
+    for failure in failures:
+        print('FAIL: {}'.format(failure))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000))
@@ -0,0 +1,233 @@
+"""
+Measures the throughput and latency of pyquanta against the local mock API
+
+Every case is run for a number of iterations and reports operations per
+second with latency percentiles. Results are saved in results/<label>.json,
+label defaulting to the current git revision, so that they can be compared
+across versions with --compare.
+
+Usage: run.py [--label LABEL] [--compare LABEL] [--iterations N] [--latency SECONDS]
+              [--items N] [--steps N] [--sites N] [--error-rate RATIO] [case ...]
+
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from mock_api import MockQuantaAPI
+
+from pyquanta import AsyncQuanta, Quanta
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def bench_list(quanta, api, i):
+    quanta.servers.list()
+
+
+def bench_get(quanta, api, i):
+    quanta.servers.get(i % api.items + 1)
+
+
+def bench_create(quanta, api, i):
+    quanta.servers.create(name='bench{}'.format(i), role='web', host='bench{}.local'.format(i))
+
+
+def bench_update(quanta, api, i):
+    server = quanta.servers(id=1, name='server1', role='web', host='web1.local')
+    server.port = 10050 + i % 2
+    server.update()
+
+
+def bench_nested_update(quanta, api, i):
+    scenario = quanta.scenarios.get(1)
+    scenario.steps[0].name = 'step {}'.format(i)
+    scenario.steps[-1]._destroy = True
+    scenario.steps.append(scenario.Step(name='added {}'.format(i), no=api.steps, url='https://shop.example.com/'))
+    scenario.update()
+
+
+def bench_list_names(quanta, api, i):
+    [scenario.name for scenario in quanta.scenarios.list()]
+
+
+def bench_lazy_list_names(quanta, api, i):
+    [scenario.name for scenario in quanta.scenarios.list(lazy=True)]
+
+
+def bench_fanout(quanta, api, i):
+    quanta.for_sites(list(api.sites)).servers.list().raise_for_errors()
+
+
+async def bench_async_fanout(quanta, api, i):
+    (await quanta.for_sites(list(api.sites)).servers.list()).raise_for_errors()
+
+
+CASES = {
+    'list': bench_list,
+    'get': bench_get,
+    'create': bench_create,
+    'update': bench_update,
+    'nested_update': bench_nested_update,
+    'list_names': bench_list_names,
+    'lazy_list_names': bench_lazy_list_names,
+    'fanout': bench_fanout,
+    'async_fanout': bench_async_fanout,
+}
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    return {
+        'ops': len(latencies),
+        'errors': errors,
+        'ops_per_sec': len(latencies) / elapsed if elapsed else 0.0,
+        'mean': sum(latencies) / len(latencies) if latencies else None,
+        'p50': percentile(0.50),
+        'p95': percentile(0.95),
+        'p99': percentile(0.99),
+    }
+
+
+def run_case(fn, api, iterations):
+    quanta = Quanta(url=api.url)
+    quanta.connect('bench@example.com', 'bench')
+    quanta.use_site(1)
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        try:
+            fn(quanta, api, i)
+        except Exception:
+            errors += 1
+        else:
+            latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    quanta.close()
+    return summarize(latencies, errors, elapsed)
+
+
+async def run_async_case(fn, api, iterations):
+    async with AsyncQuanta(url=api.url) as quanta:
+        await quanta.connect('bench@example.com', 'bench')
+        quanta.use_site(1)
+        latencies = []
+        errors = 0
+        start = time.perf_counter()
+        for i in range(iterations):
+            t = time.perf_counter()
+            try:
+                await fn(quanta, api, i)
+            except Exception:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - start
+    return summarize(latencies, errors, elapsed)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'local'
+
+
+def load(label):
+    with open(os.path.join(RESULTS_DIR, '{}.json'.format(label))) as f:
+        return json.load(f)
+
+
+def save(label, report):
+    if not os.path.isdir(RESULTS_DIR):
+        os.makedirs(RESULTS_DIR)
+    path = os.path.join(RESULTS_DIR, '{}.json'.format(label))
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    return path
+
+
+def print_report(report, baseline=None):
+    print('{:<14} {:>10} {:>10} {:>10} {:>10} {:>7}'.format(
+        'case', 'ops/s', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)', 'errors'))
+    for name, result in report['results'].items():
+        line = '{:<14} {:>10.1f} {:>10} {:>10} {:>10} {:>7}'.format(
+            name, result['ops_per_sec'],
+            *['{:.2f}'.format(result[p] * 1000) if result[p] is not None else '-'
+              for p in ('p50', 'p95', 'p99')] + [result['errors']])
+        previous = baseline['results'].get(name) if baseline else None
+        if previous and previous['ops_per_sec']:
+            change = result['ops_per_sec'] / previous['ops_per_sec'] - 1
+            line += '  {:+.1%} vs {}'.format(change, baseline['label'])
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pyquanta against a local mock API')
+    parser.add_argument('cases', nargs='*', metavar='case',
+                        help='cases to run among {}, all by default'.format(', '.join(CASES)))
+    parser.add_argument('--label', default=None, help='name of the results file, the git revision by default')
+    parser.add_argument('--compare', default=None, help='label of results to compare with')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--sites', type=int, default=10)
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error('unknown cases: {}'.format(', '.join(sorted(unknown))))
+
+    label = args.label or git_revision()
+    config = {key: getattr(args, key) for key in
+              ('iterations', 'latency', 'jitter', 'sites', 'items', 'steps', 'error_rate')}
+    report = {
+        'label': label,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'config': config,
+        'results': {},
+    }
+    for name in args.cases or CASES:
+        fn = CASES[name]
+        with MockQuantaAPI(latency=args.latency, jitter=args.jitter, sites=args.sites, items=args.items,
+                           steps=args.steps, error_rate=args.error_rate, seed=0) as api:
+            if asyncio.iscoroutinefunction(fn):
+                try:
+                    result = asyncio.run(run_async_case(fn, api, args.iterations))
+                except ImportError:
+                    print('Skipping {}: aiohttp is not installed'.format(name))
+                    continue
+            else:
+                result = run_case(fn, api, args.iterations)
+            result['server_requests'] = api.requests
+        report['results'][name] = result
+
+    baseline = load(args.compare) if args.compare else None
+    print_report(report, baseline)
+    if not args.no_save:
+        print('Results saved to {}'.format(save(label, report)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
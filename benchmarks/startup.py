@@ -0,0 +1,107 @@
+"""
+Measures the cost of importing pyquanta and of creating clients, and fails if
+it exceeds a time budget
+
+Imports are timed in fresh interpreters, the median of several runs being
+compared to the budget. The script also checks that importing pyquanta does not
+import requests or asyncio, and that creating clients adds a single log handler.
+
+Usage: startup.py [--runs N] [--clients N] [--import-budget MS] [--construct-budget US]
+
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ('requests', 'asyncio', 'aiohttp', 'sqlite3')
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import pyquanta
+imported = time.perf_counter()
+loaded = [name for name in {modules!r} if name in sys.modules]
+pyquanta.Quanta().servers
+print(json.dumps({{
+    'import': imported - start,
+    'first_client': time.perf_counter() - imported,
+    'loaded': loaded,
+}}))
+"""
+
+
+def time_import(runs):
+    """
+    Returns the import and first client durations of runs fresh interpreters,
+    and the heavy modules loaded by the import
+
+    """
+    script = IMPORT_SCRIPT.format(modules=LAZY_MODULES)
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    imports, clients, loaded = [], [], set()
+    for _ in range(runs):
+        out = subprocess.check_output([sys.executable, '-c', script], env=env, cwd=ROOT)
+        result = json.loads(out.decode())
+        imports.append(result['import'])
+        clients.append(result['first_client'])
+        loaded.update(result['loaded'])
+    return imports, clients, loaded
+
+
+def time_construct(clients):
+    """
+    Returns the mean duration of creating a client once pyquanta is imported,
+    and the number of handlers of the pyquanta logger afterwards
+
+    """
+    sys.path.insert(0, ROOT)
+    from pyquanta import Quanta
+
+    Quanta()
+    start = time.perf_counter()
+    for _ in range(clients):
+        Quanta()
+    elapsed = time.perf_counter() - start
+    return elapsed / clients, len(logging.getLogger('pyquanta').handlers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import and client creation time of pyquanta')
+    parser.add_argument('--runs', type=int, default=10, help='interpreters started to time the import')
+    parser.add_argument('--clients', type=int, default=1000, help='clients created to time construction')
+    parser.add_argument('--import-budget', type=float, default=60.0, help='milliseconds')
+    parser.add_argument('--construct-budget', type=float, default=250.0, help='microseconds')
+    args = parser.parse_args()
+
+    imports, clients, loaded = time_import(args.runs)
+    construct, handlers = time_construct(args.clients)
+    import_ms = statistics.median(imports) * 1000
+    failures = []
+    if import_ms > args.import_budget:
+        failures.append('import takes {:.1f}ms, over the {:.1f}ms budget'.format(import_ms, args.import_budget))
+    if construct * 1e6 > args.construct_budget:
+        failures.append('creating a client takes {:.0f}us, over the {:.0f}us budget'.format(
+            construct * 1e6, args.construct_budget))
+    if loaded:
+        failures.append('importing pyquanta loads {}'.format(', '.join(sorted(loaded))))
+    if handlers != 1:
+        failures.append('the pyquanta logger has {} handlers'.format(handlers))
+
+    print('import pyquanta      {:8.1f} ms (median of {} runs, budget {:.1f} ms)'.format(
+        import_ms, args.runs, args.import_budget))
+    print('first client         {:8.1f} ms (median, imports requests)'.format(statistics.median(clients) * 1000))
+    print('Quanta()             {:8.1f} us (mean of {} clients, budget {:.0f} us)'.format(
+        construct * 1e6, args.clients, args.construct_budget))
+    for failure in failures:
+        print('FAIL: {}'.format(failure))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
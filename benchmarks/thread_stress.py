@@ -0,0 +1,143 @@
+"""
+Checks that one Quanta client can be shared by many threads
+
+N threads run random reads and writes across M sites through a single client
+against the local mock API, while sessions are expired periodically. The
+script checks that every call reached the site it was meant for, that no call
+failed and that each expiration caused a single login.
+
+Usage: thread_stress.py [--threads N] [--sites M] [--iterations N] [--expire-every SECONDS]
+
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+
+from mock_api import MockQuantaAPI
+
+from pyquanta import Quanta
+
+
+class Stress(object):
+    """
+    The shared state of a stress run
+
+    """
+
+    def __init__(self, quanta, api, iterations):
+        self.quanta = quanta
+        self.api = api
+        self.iterations = iterations
+        self.ops = 0
+        self.errors = []
+        self.created = {site: set() for site in api.sites}
+        self._lock = threading.Lock()
+
+
+    def fail(self, message):
+        with self._lock:
+            self.errors.append(message)
+
+
+    def worker(self, n):
+        rng = random.Random(n)
+        for i in range(self.iterations):
+            site = rng.choice(list(self.api.sites))
+            scope = self.quanta.for_site(site)
+            op = rng.choice((self.check_analytics, self.check_create, self.check_list, self.check_scenario))
+            try:
+                op(scope, site, '{}-{}'.format(n, i))
+            except Exception as e:
+                self.fail('{} on site {}: {!r}'.format(op.__name__, site, e))
+            with self._lock:
+                self.ops += 1
+
+
+    def check_analytics(self, scope, site, tag):
+        account = scope.analytics.get()
+        if account.profile_id != str(site):
+            self.fail('analytics of site {} returned profile {}'.format(site, account.profile_id))
+
+
+    def check_create(self, scope, site, tag):
+        host = 'stress-{}.site{}'.format(tag, site)
+        server = scope.servers.create(name=tag, role='web', host=host)
+        if scope.servers.get(server.id).host != host:
+            self.fail('server {} of site {} not found'.format(server.id, site))
+        with self._lock:
+            self.created[site].add(host)
+
+
+    def check_list(self, scope, site, tag):
+        for server in scope.servers.list():
+            if server.host.startswith('stress-') and not server.host.endswith('.site{}'.format(site)):
+                self.fail('server {} listed on site {}'.format(server.host, site))
+
+
+    def check_scenario(self, scope, site, tag):
+        scenario = scope.scenarios.get(1)
+        if len(scenario.steps) != self.api.steps:
+            self.fail('scenario of site {} has {} steps'.format(site, len(scenario.steps)))
+
+
+    def check_state(self):
+        for site, hosts in self.created.items():
+            stored = set(server['host'] for server in self.api.sites[site].servers.values())
+            missing = hosts - stored
+            if missing:
+                self.fail('{} servers missing on site {}'.format(len(missing), site))
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stress a Quanta client shared by many threads')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--sites', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--expire-every', type=float, default=0.25)
+    args = parser.parse_args()
+
+    with MockQuantaAPI(sites=args.sites, items=5, steps=5, auth=True) as api:
+        quanta = Quanta(url=api.url, pool_maxsize=args.threads)
+        quanta.connect('stress@example.com', 'stress')
+        stress = Stress(quanta, api, args.iterations)
+        done = threading.Event()
+        expirations = [0]
+
+        def expire():
+            while not done.wait(args.expire_every):
+                api.expire_sessions()
+                expirations[0] += 1
+
+        expirer = threading.Thread(target=expire)
+        expirer.start()
+        threads = [threading.Thread(target=stress.worker, args=(n,)) for n in range(args.threads)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+        done.set()
+        expirer.join()
+        stress.check_state()
+
+        logins = api.logins - 1
+        if logins > expirations[0]:
+            stress.fail('{} logins for {} session expirations'.format(logins, expirations[0]))
+        print('{} threads, {} sites: {} operations in {:.2f}s ({:.0f} ops/s)'.format(
+            args.threads, args.sites, stress.ops, elapsed, stress.ops / elapsed))
+        print('{} session expirations, {} logins'.format(expirations[0], logins))
+        print('Pool: {}'.format(quanta.pool_stats))
+        quanta.close()
+
+    for error in stress.errors[:20]:
+        print('ERROR: {}'.format(error))
+    print('{} errors'.format(len(stress.errors)))
+    return 1 if stress.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
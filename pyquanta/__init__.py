@@ -1,32 +1,104 @@
 """
 Main module for pyquanta
 
-Contains base class: Quanta
+Contains base classes: Quanta and AsyncQuanta
 
 """
-import json
 import logging
-import requests
-
-from .resources import get_obj_class
+import threading
+import time
+from urllib.parse import urljoin
+
+from .cache import ResponseCache, ValidatorStore
+from .codec import get_codec, pretty
+from .fanout import SiteScope, SiteFanout
+from .instrumentation import RequestEvent, PrometheusCollector, OpenTelemetryEmitter
+from .resources import get_obj_class, BoundResource
+from .scheduler import Scheduler, RetryPolicy, TokenBucket
+from .session import FileSessionStore, MemorySessionStore
+from .singleflight import SingleFlight, AsyncSingleFlight
+from .snapshot import SnapshotStore
 from .resources import Scenario, Server, Endpoint, Account, Organization, Site
 
 from .exceptions import APIError, AttrError
 
+# Shared by every client, so that creating clients does not pile up handlers
+_handler = logging.StreamHandler()
+
 
 class Quanta:
     """
     The main class to interact with Quanta API
 
+    An instance can be shared by several threads once connected: the token is
+    renewed under a lock and requests use a consistent copy of the headers.
+    Threads working on different sites should use `for_site` rather than
+    `use_site`, and pool_maxsize should be at least the number of threads.
+
+    requests is imported by the first instance and resources are bound to the
+    instance when first accessed, so that creating a client is cheap.
+
     """
     BASE_URL = "https://www.quanta-monitoring.com"
     API_URL = "/api"
+    SESSION_EXPIRED_STATUSES = (401,)
+
+    sites = BoundResource(Site)
+    organizations = BoundResource(Organization)
+    scenarios = BoundResource(Scenario)
+    servers = BoundResource(Server)
+    magento_monitor = BoundResource(Endpoint)
+    analytics = BoundResource(Account)
 
 
-    def __init__(self, url=None, debug=False):
+    def __init__(self, url=None, debug=False, pool_connections=10, pool_maxsize=10,
+                 max_retries=0, pool_block=False, keep_alive=None, cache=None,
+                 validators=None, codec=None, scheduler=None, snapshot=None):
         """
         Initialize Quanta instance with different parameters
 
+        pool_connections is the number of hosts to keep a pool for, pool_maxsize
+        the number of connections kept per host (at most pool_maxsize
+        concurrent connections per host if pool_block is set), max_retries the
+        number of retries on connection errors and keep_alive the number of
+        seconds an idle connection is kept in the pool (forever if None)
+
+        cache is an optional ResponseCache used for GET requests and validators
+        an optional ValidatorStore used to revalidate GET responses with
+        conditional requests
+
+        codec is the JSON codec (or the name of the codec) used for request and
+        response bodies, the fastest installed one if None
+
+        scheduler is the Scheduler rate limiting and retrying requests, by
+        default idempotent requests are retried on 429/502/503/504 responses and
+        connection errors without rate limit
+
+        snapshot is an optional SnapshotStore keeping GET responses on disk
+        between runs, stale snapshots being refreshed in the background
+
+        """
+        import requests
+        from .pool import PooledAdapter
+
+        self._init_client(url, debug, cache, validators, codec, scheduler, snapshot)
+        self.adapter = PooledAdapter(
+            keep_alive=keep_alive,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=max_retries,
+            pool_block=pool_block,
+            )
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+
+    def _init_client(self, url, debug, cache=None, validators=None, codec=None, scheduler=None,
+                     snapshot=None):
+        """
+        Initialize the transport-independent state of the client
+
         """
         if url:
             self.url = url
@@ -37,55 +109,390 @@ class Quanta:
             'Accept': 'application/json'
             }
         self.token = None
-        self.cookies = requests.cookies.RequestsCookieJar()
+        self.site = None
+        self.session_store = None
+        self.session_max_age = None
+        self._credentials = None
+        self._login_lock = threading.RLock()
+        self._obj_classes = {}
+        self._indexes = {}
+        self.cache = cache
+        self.validators = validators
+        self.snapshot = snapshot
+        if codec is None or isinstance(codec, str):
+            codec = get_codec(codec)
+        self.codec = codec
+        if scheduler is None:
+            scheduler = Scheduler(retry=RetryPolicy())
+        self.scheduler = scheduler
+        self.observers = []
+        self.inflight = SingleFlight()
 
         self.logger = logging.getLogger("pyquanta")
-        if debug:
-            self.logger.setLevel(logging.DEBUG)
-        else:
-            self.logger.setLevel(logging.INFO)
-        self.logger.addHandler(logging.StreamHandler())
+        level = logging.DEBUG if debug else logging.INFO
+        # Setting the level clears the caches of every logger, skip it if unchanged
+        if self.logger.level != level:
+            self.logger.setLevel(level)
+        self.logger.addHandler(_handler)
 
-        self.sites = get_obj_class(Site, self, self.logger)
-        self.organizations = get_obj_class(Organization, self, self.logger)
-        self.scenarios = get_obj_class(Scenario, self, self.logger)
-        self.servers = get_obj_class(Server, self, self.logger)
-        self.magento_monitor = get_obj_class(Endpoint, self, self.logger)
-        self.analytics = get_obj_class(Account, self, self.logger)
 
+    def _bind(self, klass, site=None):
+        """
+        Returns a subclass of the resource klass bound to this instance, and to
+        site if specified
 
-    def _request(self, route, data, method, jsonify=True, verify=True):
+        """
+        return get_obj_class(klass, self, self.logger, _site=site)
+
+
+    def _request(self, route, data, method, jsonify=True, verify=True, ttl=None, fresh=False):
         """
         Executes an HTTP method on Quanta API
 
+        GET responses are served from and stored in the cache if there is one,
+        for ttl seconds (the cache default if None), and revalidated with their
+        ETag/Last-Modified validators if there is a validator store. They are
+        also served from and saved to the snapshot store if there is one, unless
+        fresh is set. Other methods invalidate the cached responses of the route
+
+        Concurrent identical GET requests are coalesced: only the first one is
+        sent and the others share its parsed response
+
+        A RequestEvent is emitted to the observers once the request is done
+
+        """
+        event = RequestEvent(method, route) if self.observers else None
+        token = self.token
+        try:
+            if method == 'GET' and jsonify:
+                r, shared = self.inflight.do(
+                    (route, token, verify, fresh),
+                    lambda: self._execute_authenticated(route, data, method, jsonify, verify, ttl,
+                                                        event, fresh, token),
+                    )
+                if shared and event is not None:
+                    event.coalesced = True
+                return r
+            return self._execute_authenticated(route, data, method, jsonify, verify, ttl, event,
+                                               fresh, token)
+        except Exception as e:
+            if event is not None:
+                event.error = e
+            raise
+        finally:
+            if event is not None:
+                self._emit(event)
+
+
+    def _execute_authenticated(self, route, data, method, jsonify, verify, ttl, event, fresh, token):
+        """
+        Executes a request, logging in again and retrying it once if the
+        session sending it with token was rejected
+
+        """
+        try:
+            return self._execute(route, data, method, jsonify, verify, ttl, event, fresh)
+        except APIError as e:
+            if not self._session_rejected(e, route):
+                raise
+        self._relogin(token)
+        return self._execute(route, data, method, jsonify, verify, ttl, event, fresh)
+
+
+    def _execute(self, route, data, method, jsonify, verify, ttl, event, fresh=False):
         """
+        Executes an HTTP method on Quanta API, recording measurements in event
+        if it is not None
+
+        """
+        cacheable = method == 'GET' and jsonify
+        if cacheable and self.cache is not None:
+            cached = self.cache.get(route)
+            if cached is not None:
+                if event is not None:
+                    event.cache_hit = True
+                return cached
+        if cacheable and self.snapshot is not None and not fresh:
+            snapshot = self._from_snapshot(route, verify, ttl)
+            if snapshot is not None:
+                if event is not None:
+                    event.cache_hit = True
+                return snapshot
+        headers, validator = self._conditional_headers(route, cacheable)
         url = "{}{}".format(self.url, route)
         if data is not None:
-            data = json.dumps(data)
-        self.logger.debug("{} {}".format(method.__name__.upper(), url))
-        r = method(url, headers=self.headers, data=data, cookies=self.cookies, verify=verify)
+            data = self.codec.dumps(data)
+        r = self._send(method, url, event, headers=headers, data=data, verify=verify)
+        if method != 'GET':
+            self._invalidate(route)
+        if r.status_code == 304 and validator is not None:
+            return self._not_modified(route, validator, ttl)
+        self._raise_for_status(r)
+        if jsonify:
+            size = len(r.content)
+            response_headers = r.headers
+            r = self.codec.loads(r.content)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(pretty(r))
+            if 'error' in r:
+                raise APIError(r['error'])
+            if cacheable:
+                self._store(route, r, size, ttl, response_headers)
+        return r
+
+
+    def _send(self, method, url, event=None, **kwargs):
+        """
+        Send a request once the rate limit allows it, retrying it according to
+        the retry policy of the scheduler, and returns the response
+
+        """
+        import requests
+
+        attempt = 0
+        while True:
+            delay = self.scheduler.reserve()
+            if delay:
+                time.sleep(delay)
+            self.logger.debug("{} {}".format(method, url))
+            sent = time.time()
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                delay = self.scheduler.retry_delay(method, attempt)
+                if delay is None:
+                    raise
+            else:
+                if event is not None:
+                    self._measure(event, r, sent, attempt, kwargs)
+                if r.status_code < 400:
+                    return r
+                delay = self.scheduler.retry_delay(method, attempt, r.status_code, r.headers)
+                if delay is None:
+                    return r
+                r.close()
+            attempt += 1
+            self.logger.debug("Retrying {} {} in {:.2f}s".format(method, url, delay))
+            time.sleep(delay)
+
+
+    def _measure(self, event, r, sent, attempt, kwargs):
+        """
+        Record the measurements of the response r in event
+
+        """
+        event.status = r.status_code
+        event.retries = attempt
+        event.ttfb = r.elapsed.total_seconds()
+        data = kwargs.get('data')
+        event.bytes_out = len(data) if data is not None else 0
+        if not kwargs.get('stream'):
+            event.transfer = max(time.time() - sent - event.ttfb, 0.0)
+            event.bytes_in = len(r.content)
+
+
+    def _emit(self, event):
+        """
+        Send event to the observers, errors raised by observers being logged
+
+        """
+        event.finish()
+        for observer in self.observers:
+            try:
+                observer(event)
+            except Exception:
+                self.logger.exception("Request observer {!r} failed".format(observer))
+
+
+    def add_observer(self, observer):
+        """
+        Register observer, a callable receiving a RequestEvent after each
+        request
+
+        """
+        self.observers.append(observer)
+        return observer
+
+
+    def remove_observer(self, observer):
+        """
+        Unregister observer
+
+        """
+        self.observers.remove(observer)
+
+
+    def _conditional_headers(self, route, cacheable):
+        """
+        Returns the headers of a request to route, with the validators of its
+        previous response if any, and the validators entry
+
+        """
+        headers = self.headers
+        if not cacheable or self.validators is None:
+            return headers, None
+        validator = self.validators.get(route)
+        if validator is None:
+            return headers, None
+        headers = dict(headers)
+        headers.update(self.validators.conditional_headers(validator))
+        return headers, validator
+
+
+    def _not_modified(self, route, validator, ttl):
+        """
+        Returns the previous response of route after a 304 Not Modified
+
+        """
+        self.logger.debug("{} not modified".format(route))
+        r = self.validators.not_modified(validator)
+        if self.cache is not None:
+            self.cache.set(route, r, validator[3], ttl)
+        if self.snapshot is not None:
+            self.snapshot.set("{}{}".format(self.url, route), r)
+        return r
+
+
+    def _from_snapshot(self, route, verify, ttl):
+        """
+        Returns the snapshot of route if it is not too old, refreshing it in the
+        background if it is stale
+
+        """
+        key = "{}{}".format(self.url, route)
+        snapshot = self.snapshot.get(key)
+        if snapshot is None:
+            return None
+        response, age = snapshot
+        if self.snapshot.is_stale(age) and self.snapshot.begin_refresh(key):
+            self.logger.debug("Refreshing snapshot of {} ({:.0f}s old)".format(route, age))
+            threading.Thread(target=self._refresh_snapshot, args=(key, route, verify, ttl)).start()
+        return response
+
+
+    def _refresh_snapshot(self, key, route, verify, ttl):
+        """
+        Fetch route again to refresh its snapshot
+
+        """
+        try:
+            self._request(route, None, 'GET', verify=verify, ttl=ttl, fresh=True)
+        except Exception:
+            self.logger.exception("Could not refresh the snapshot of {}".format(route))
+        finally:
+            self.snapshot.end_refresh(key)
+
+
+    def _store(self, route, response, size, ttl, headers):
+        """
+        Store a parsed GET response in the cache, its validators and the
+        snapshot store
+
+        """
+        if self.cache is not None:
+            self.cache.set(route, response, size, ttl)
+        if self.validators is not None:
+            self.validators.set(route, headers, response, size)
+        if self.snapshot is not None:
+            self.snapshot.set("{}{}".format(self.url, route), response)
+
+
+    def _invalidate(self, route):
+        """
+        Invalidate cached responses and validators after a change on route
+
+        """
+        if self.cache is not None:
+            self.cache.invalidate(route)
+        if self.validators is not None:
+            self.validators.invalidate(route)
+        if self.snapshot is not None:
+            self.snapshot.invalidate("{}{}".format(self.url, route))
+
+
+    def _raise_for_status(self, r):
+        """
+        Raise an APIError if the response r is not successful
+
+        """
         if r.status_code != 200:
             try:
-                r = r.json()
-                err = r['error']
-            except:
+                err = self.codec.loads(r.content)['error']
+            except Exception:
                 err = 'HTTP Error {} returned from server'.format(r.status_code)
+            raise APIError(err, r.status_code)
+
+
+    def _stream(self, route, key, verify=True):
+        """
+        Retrieves the list key from quanta API and yields its items one at a
+        time, following the next pages advertised in the Link header
+
+        Items are parsed incrementally if ijson is installed. A page rejected
+        because the session expired is sent again once logged in again
+
+        """
+        url = "{}{}".format(self.url, route)
+        while url is not None:
+            event = RequestEvent('GET', url[len(self.url):]) if self.observers else None
+            r = None
+            try:
+                token = self.token
+                r = self._send('GET', url, event, headers=self.headers, verify=verify, stream=True)
+                try:
+                    self._raise_for_status(r)
+                except APIError as e:
+                    if not self._session_rejected(e, route):
+                        raise
+                    r.close()
+                    r = None
+                    self._relogin(token)
+                    r = self._send('GET', url, event, headers=self.headers, verify=verify, stream=True)
+                    self._raise_for_status(r)
+                for item in self._iter_items(r, key):
+                    yield item
+                next_page = r.links.get('next')
+                url = urljoin(url, next_page['url']) if next_page else None
+            except Exception as e:
+                if event is not None:
+                    event.error = e
+                raise
             finally:
-                raise APIError(err)
-        if jsonify:
-            r = r.json()
-            self.logger.debug(json.dumps(r, indent=2))
+                if r is not None:
+                    if event is not None and r.raw is not None:
+                        event.bytes_in = r.raw.tell()
+                    r.close()
+                if event is not None:
+                    self._emit(event)
+
+
+    def _iter_items(self, r, key):
+        """
+        Yields the items of the list key from the response r
+
+        """
+        try:
+            import ijson
+        except ImportError:
+            ijson = None
+        if ijson is None:
+            r = self.codec.loads(r.content)
             if 'error' in r:
                 raise APIError(r['error'])
-        return r
+            for item in r[key]:
+                yield item
+        else:
+            r.raw.decode_content = True
+            for item in ijson.items(r.raw, '{}.item'.format(key), use_float=True):
+                yield item
 
 
-    def _get(self, route, jsonify=True, verify=True):
+    def _get(self, route, jsonify=True, verify=True, ttl=None):
         """
         Retrieves information from quanta API
 
         """
-        return self._request(route, None, requests.get, jsonify, verify)
+        return self._request(route, None, 'GET', jsonify, verify, ttl)
 
 
     def _post(self, route, data, jsonify=True, verify=True):
@@ -93,7 +500,7 @@ class Quanta:
         Post information to quanta API
 
         """
-        return self._request(route, data, requests.post, jsonify, verify)
+        return self._request(route, data, 'POST', jsonify, verify)
 
 
     def _put(self, route, data, jsonify=True, verify=True):
@@ -101,7 +508,7 @@ class Quanta:
         Update an object in the API
 
         """
-        return self._request(route, data, requests.put, jsonify, verify)
+        return self._request(route, data, 'PUT', jsonify, verify)
 
 
     def _delete(self, route, jsonify=True, verify=True):
@@ -109,28 +516,177 @@ class Quanta:
         Delete an object from API
 
         """
-        return self._request(route, None, requests.put, jsonify, verify)
+        return self._request(route, None, 'DELETE', jsonify, verify)
 
 
-    def connect(self, login, password):
+    def connect(self, login, password, store=None, max_age=None):
         """
         Connect to the API with provided login and password
         This method will retrieve useful tokens and cookies
 
+        If store is given (see `pyquanta.session`), the session saved in it is
+        reused if it is not expired, and the new session is saved to it
+        otherwise. max_age bounds the lifetime of saved sessions in seconds.
+        The session is renewed transparently if the API rejects it.
+
+        """
+        with self._login_lock:
+            self._credentials = (login, password)
+            self.session_store = store
+            self.session_max_age = max_age
+            if store is not None and self.load_session(store):
+                self.logger.debug("Reusing saved session with token: {}".format(self.token))
+                return
+            self._login(login, password)
+            if store is not None:
+                self.save_session(store)
+
+
+    def _login(self, login, password):
+        """
+        Run the login handshake to get a CSRF token and session cookies
+
         """
         payload = {"user": {"email": login, "password": password}}
         r = self._get("/users/login.json", jsonify=False)
-        self.token = str(r.json().pop("csrf_token"))
-        self.headers['X-CSRF-Token'] = self.token
-        self.cookies = r.cookies
+        self._set_token(str(self.codec.loads(r.content).pop("csrf_token")))
 
         r = self._post("/users/login", payload, jsonify=False)
-        self.token = str(r.json().pop("csrf_token"))
-        self.headers['X-CSRF-Token'] = self.token
-        self.cookies = r.cookies
+        self._set_token(str(self.codec.loads(r.content).pop("csrf_token")))
         self.logger.debug("Successfully connected with token: {}".format(self.token))
 
 
+    def _set_token(self, token):
+        """
+        Set the CSRF token sent with requests
+
+        The headers dict is replaced rather than modified, so that requests
+        being sent by other threads keep a consistent copy
+
+        """
+        headers = dict(self.headers)
+        headers['X-CSRF-Token'] = token
+        self.headers = headers
+        self.token = token
+
+
+    def _session_rejected(self, error, route):
+        """
+        Returns True if error means the session expired and it can be renewed
+
+        """
+        return (error.status_code in self.SESSION_EXPIRED_STATUSES
+                and self._credentials is not None
+                and not route.startswith('/users/login'))
+
+
+    def _relogin(self, token):
+        """
+        Renew the session rejected while token was in use, unless another
+        thread already did
+
+        """
+        with self._login_lock:
+            if self.token != token:
+                return
+            self.logger.debug("Session rejected, logging in again")
+            self._login(*self._credentials)
+            if self.session_store is not None:
+                self.save_session(self.session_store)
+
+
+    def session_state(self):
+        """
+        Returns the state of the authenticated session as a JSON-serializable
+        dict: API URL, CSRF token, cookies and expiry timestamp (or None)
+
+        """
+        cookies = self._export_cookies()
+        expiries = [cookie['expires'] for cookie in cookies if cookie['expires'] is not None]
+        if self.session_max_age is not None:
+            expiries.append(time.time() + self.session_max_age)
+        return {
+            'url': self.url,
+            'token': self.token,
+            'cookies': cookies,
+            'expires': min(expiries) if expiries else None,
+        }
+
+
+    def save_session(self, store):
+        """
+        Save the authenticated session to store
+
+        """
+        store.save(self.session_state())
+
+
+    def load_session(self, store):
+        """
+        Restore the session saved in store, returns False if there is none or
+        it is expired or for another API
+
+        """
+        state = store.load()
+        if not state or state.get('url') != self.url or not state.get('token'):
+            return False
+        if state.get('expires') is not None and state['expires'] <= time.time():
+            return False
+        self._set_token(state['token'])
+        self._import_cookies(state.get('cookies', []))
+        return True
+
+
+    def _export_cookies(self):
+        return [
+            {
+                'name': cookie.name,
+                'value': cookie.value,
+                'domain': cookie.domain,
+                'path': cookie.path,
+                'expires': cookie.expires,
+                'secure': cookie.secure,
+            }
+            for cookie in self.session.cookies
+        ]
+
+
+    def _import_cookies(self, cookies):
+        for cookie in cookies:
+            self.session.cookies.set(
+                cookie['name'], cookie['value'], domain=cookie.get('domain', ''),
+                path=cookie.get('path', '/'), expires=cookie.get('expires'),
+                secure=cookie.get('secure', False),
+            )
+
+
+    @property
+    def cookies(self):
+        """
+        Returns the cookies of the current session
+
+        """
+        return self.session.cookies
+
+
+    @property
+    def pool_stats(self):
+        """
+        Returns connection pool counters: requests sent, connections opened and
+        connections reused
+
+        """
+        return self.adapter.stats
+
+
+    def close(self):
+        """
+        Close every pooled connection
+
+        """
+        self.session.close()
+
+
     @property
     def site_route(self):
         """
@@ -144,5 +700,37 @@ class Quanta:
         """
         Set the current instance to use site_id
 
+        The current site is shared by every thread using the instance, threads
+        working on different sites should use `for_site` instead
+
         """
         self.site = site_id
+
+
+    def for_site(self, site_id):
+        """
+        Returns a view of the instance whose resources are routed to site_id,
+        without changing the current site
+
+        """
+        return SiteScope(self, site_id)
+
+
+    def for_sites(self, site_ids, max_workers=10):
+        """
+        Returns an executor running resource calls for every site of site_ids
+        concurrently, e.g. `quanta.for_sites([1, 2]).servers.list()`
+
+        """
+        return SiteFanout(self, site_ids, max_workers)
+
+
+def __getattr__(name):
+    """
+    Import AsyncQuanta, and asyncio with it, only when it is used
+
+    """
+    if name == 'AsyncQuanta':
+        from .aio import AsyncQuanta
+        return AsyncQuanta
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,547 @@
+"""
+This module contains the asyncio client: AsyncQuanta
+
+It requires aiohttp to be installed
+
+"""
+import asyncio
+import logging
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.cookies import SimpleCookie
+from urllib.parse import urljoin
+
+from . import Quanta
+from .fanout import AsyncSiteFanout
+from .instrumentation import RequestEvent
+from .singleflight import AsyncSingleFlight
+from .resources import get_obj_class
+from .resources.base import BaseObject, SingleObject
+from .resources.aio import AsyncBaseObject, AsyncSingleObject
+from .codec import pretty
+from .exceptions import APIError
+
+
+class AsyncQuanta(Quanta):
+    """
+    An asyncio version of the Quanta client
+
+    Every request method and resource method is a coroutine, requests are sent
+    over a bounded pool of keep-alive connections shared by the event loop.
+
+    """
+
+    def __init__(self, url=None, debug=False, limit=100, limit_per_host=0, keep_alive=15,
+                 cache=None, validators=None, codec=None, scheduler=None, snapshot=None):
+        """
+        Initialize AsyncQuanta instance with different parameters
+
+        limit is the maximum number of simultaneous connections, limit_per_host
+        the same limit for each host (0 for no limit) and keep_alive the number
+        of seconds an idle connection is kept in the pool
+
+        cache is an optional ResponseCache used for GET requests and validators
+        an optional ValidatorStore used to revalidate GET responses with
+        conditional requests
+
+        codec is the JSON codec (or the name of the codec) used for request and
+        response bodies, the fastest installed one if None
+
+        scheduler is the Scheduler rate limiting and retrying requests, by
+        default idempotent requests are retried on 429/502/503/504 responses and
+        connection errors without rate limit
+
+        snapshot is an optional SnapshotStore keeping GET responses on disk
+        between runs, stale snapshots being refreshed in the background
+
+        """
+        self._init_client(url, debug, cache, validators, codec, scheduler, snapshot)
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keep_alive = keep_alive
+        self.session = None
+        self._stats = {'requests': 0, 'connections': 0, 'reused': 0}
+        self._refreshes = set()
+        self._async_login_lock = None
+        self.inflight = AsyncSingleFlight()
+
+
+    def _bind(self, klass, site=None):
+        """
+        Returns a subclass of the resource klass bound to this instance, and to
+        site if specified, with asynchronous methods
+
+        """
+        if issubclass(klass, BaseObject):
+            mixin = AsyncBaseObject
+        elif issubclass(klass, SingleObject):
+            mixin = AsyncSingleObject
+        else:
+            mixin = None
+        return get_obj_class(klass, self, self.logger, mixin, site)
+
+
+    def for_sites(self, site_ids, max_workers=10):
+        """
+        Returns an executor awaiting resource calls for every site of site_ids
+        concurrently, e.g. `await quanta.for_sites([1, 2]).servers.list()`
+
+        """
+        return AsyncSiteFanout(self, site_ids, max_workers)
+
+
+    def _get_session(self):
+        """
+        Returns the aiohttp session, creating it on first use
+
+        """
+        if self.session is None:
+            try:
+                import aiohttp
+            except ImportError:
+                raise ImportError('AsyncQuanta requires aiohttp to be installed')
+            trace = aiohttp.TraceConfig()
+            trace.on_request_start.append(self._on_request_start)
+            trace.on_request_end.append(self._on_request_end)
+            trace.on_dns_resolvehost_start.append(self._on_dns_start)
+            trace.on_dns_resolvehost_end.append(self._on_dns_end)
+            trace.on_connection_create_start.append(self._on_connection_create_start)
+            trace.on_connection_create_end.append(self._on_connection_create)
+            trace.on_connection_reuseconn.append(self._on_connection_reuse)
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keep_alive,
+                )
+            self.session = aiohttp.ClientSession(connector=connector, trace_configs=[trace])
+        return self.session
+
+
+    async def _on_request_start(self, session, ctx, params):
+        self._stats['requests'] += 1
+        if ctx.trace_request_ctx is not None:
+            ctx.trace_request_ctx._sent = time.time()
+
+
+    async def _on_request_end(self, session, ctx, params):
+        if ctx.trace_request_ctx is not None:
+            event = ctx.trace_request_ctx
+            event.ttfb = time.time() - event._sent
+
+
+    async def _on_dns_start(self, session, ctx, params):
+        if ctx.trace_request_ctx is not None:
+            ctx.trace_request_ctx._dns_start = time.time()
+
+
+    async def _on_dns_end(self, session, ctx, params):
+        if ctx.trace_request_ctx is not None:
+            event = ctx.trace_request_ctx
+            event.dns = time.time() - event._dns_start
+
+
+    async def _on_connection_create_start(self, session, ctx, params):
+        if ctx.trace_request_ctx is not None:
+            ctx.trace_request_ctx._connect_start = time.time()
+
+
+    async def _on_connection_create(self, session, ctx, params):
+        self._stats['connections'] += 1
+        if ctx.trace_request_ctx is not None:
+            event = ctx.trace_request_ctx
+            event.connect = time.time() - event._connect_start
+
+
+    async def _on_connection_reuse(self, session, ctx, params):
+        self._stats['reused'] += 1
+
+
+    async def _request(self, route, data, method, jsonify=True, verify=True, ttl=None, fresh=False):
+        """
+        Executes an HTTP method on Quanta API
+
+        GET responses are served from and stored in the cache if there is one,
+        for ttl seconds (the cache default if None), and revalidated with their
+        ETag/Last-Modified validators if there is a validator store. They are
+        also served from and saved to the snapshot store if there is one, unless
+        fresh is set. Other methods invalidate the cached responses of the route
+
+        Concurrent identical GET requests are coalesced: only the first one is
+        sent and the others share its parsed response
+
+        A RequestEvent is emitted to the observers once the request is done
+
+        """
+        event = RequestEvent(method, route) if self.observers else None
+        token = self.token
+        try:
+            if method == 'GET' and jsonify:
+                r, shared = await self.inflight.do(
+                    (route, token, verify, fresh),
+                    lambda: self._execute_authenticated(route, data, method, jsonify, verify, ttl,
+                                                        event, fresh, token),
+                    )
+                if shared and event is not None:
+                    event.coalesced = True
+                return r
+            return await self._execute_authenticated(route, data, method, jsonify, verify, ttl,
+                                                     event, fresh, token)
+        except Exception as e:
+            if event is not None:
+                event.error = e
+            raise
+        finally:
+            if event is not None:
+                self._emit(event)
+
+
+    async def _execute_authenticated(self, route, data, method, jsonify, verify, ttl, event, fresh,
+                                     token):
+        """
+        Executes a request, logging in again and retrying it once if the
+        session sending it with token was rejected
+
+        """
+        try:
+            return await self._execute(route, data, method, jsonify, verify, ttl, event, fresh)
+        except APIError as e:
+            if not self._session_rejected(e, route):
+                raise
+        await self._relogin(token)
+        return await self._execute(route, data, method, jsonify, verify, ttl, event, fresh)
+
+
+    async def _execute(self, route, data, method, jsonify, verify, ttl, event, fresh=False):
+        """
+        Executes an HTTP method on Quanta API, recording measurements in event
+        if it is not None, and returns the decoded response, or its raw body
+        if jsonify is False
+
+        """
+        cacheable = method == 'GET' and jsonify
+        if cacheable and self.cache is not None:
+            cached = self.cache.get(route)
+            if cached is not None:
+                if event is not None:
+                    event.cache_hit = True
+                return cached
+        if cacheable and self.snapshot is not None and not fresh:
+            snapshot = self._from_snapshot(route, verify, ttl)
+            if snapshot is not None:
+                if event is not None:
+                    event.cache_hit = True
+                return snapshot
+        headers, validator = self._conditional_headers(route, cacheable)
+        url = "{}{}".format(self.url, route)
+        if data is not None:
+            data = self.codec.dumps(data)
+        r = await self._send(method, url, event, headers=headers, data=data,
+                             ssl=None if verify else False)
+        body = await self._read(r, event)
+        if method != 'GET':
+            self._invalidate(route)
+        if r.status == 304 and validator is not None:
+            return self._not_modified(route, validator, ttl)
+        self._raise_for_body(r.status, body)
+        if jsonify:
+            response_headers = r.headers
+            r = self.codec.loads(body)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(pretty(r))
+            if 'error' in r:
+                raise APIError(r['error'])
+            if cacheable:
+                self._store(route, r, len(body), ttl, response_headers)
+            return r
+        return body
+
+
+    def _from_snapshot(self, route, verify, ttl):
+        """
+        Returns the snapshot of route if it is not too old, refreshing it in a
+        background task if it is stale
+
+        """
+        key = "{}{}".format(self.url, route)
+        snapshot = self.snapshot.get(key)
+        if snapshot is None:
+            return None
+        response, age = snapshot
+        if self.snapshot.is_stale(age) and self.snapshot.begin_refresh(key):
+            self.logger.debug("Refreshing snapshot of {} ({:.0f}s old)".format(route, age))
+            task = asyncio.ensure_future(self._refresh_snapshot(key, route, verify, ttl))
+            self._refreshes.add(task)
+            task.add_done_callback(self._refreshes.discard)
+        return response
+
+
+    async def _refresh_snapshot(self, key, route, verify, ttl):
+        """
+        Fetch route again to refresh its snapshot
+
+        """
+        try:
+            await self._request(route, None, 'GET', verify=verify, ttl=ttl, fresh=True)
+        except Exception:
+            self.logger.exception("Could not refresh the snapshot of {}".format(route))
+        finally:
+            self.snapshot.end_refresh(key)
+
+
+    async def _send(self, method, url, event=None, **kwargs):
+        """
+        Send a request once the rate limit allows it, retrying it according to
+        the retry policy of the scheduler, and returns the response whose body
+        is not read yet
+
+        """
+        import aiohttp
+        session = self._get_session()
+        attempt = 0
+        while True:
+            delay = self.scheduler.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+            self.logger.debug("{} {}".format(method, url))
+            try:
+                r = await session.request(method, url, trace_request_ctx=event, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                delay = self.scheduler.retry_delay(method, attempt)
+                if delay is None:
+                    raise
+            else:
+                if event is not None:
+                    event.status = r.status
+                    event.retries = attempt
+                    data = kwargs.get('data')
+                    event.bytes_out = len(data) if data is not None else 0
+                if r.status < 400:
+                    return r
+                delay = self.scheduler.retry_delay(method, attempt, r.status, r.headers)
+                if delay is None:
+                    return r
+                r.release()
+            attempt += 1
+            self.logger.debug("Retrying {} {} in {:.2f}s".format(method, url, delay))
+            await asyncio.sleep(delay)
+
+
+    async def _read(self, r, event=None):
+        """
+        Read the body of the response r and release its connection
+
+        """
+        try:
+            body = await r.read()
+        finally:
+            r.release()
+        if event is not None:
+            event.bytes_in = len(body)
+            if event.ttfb is not None:
+                event.transfer = max(time.time() - event._sent - event.ttfb, 0.0)
+        return body
+
+
+    def _raise_for_body(self, status, body):
+        """
+        Raise an APIError if the response status is not successful
+
+        """
+        if status != 200:
+            try:
+                err = self.codec.loads(body)['error']
+            except Exception:
+                err = 'HTTP Error {} returned from server'.format(status)
+            raise APIError(err, status)
+
+
+    async def _stream(self, route, key, verify=True):
+        """
+        Retrieves the list key from quanta API and yields its items one at a
+        time, following the next pages advertised in the Link header
+
+        Items are parsed incrementally if ijson is installed. A page rejected
+        because the session expired is sent again once logged in again
+
+        """
+        url = "{}{}".format(self.url, route)
+        while url is not None:
+            event = RequestEvent('GET', url[len(self.url):]) if self.observers else None
+            r = None
+            try:
+                token = self.token
+                r = await self._send('GET', url, event, headers=self.headers,
+                                     ssl=None if verify else False)
+                if r.status != 200:
+                    try:
+                        self._raise_for_body(r.status, await r.read())
+                    except APIError as e:
+                        if not self._session_rejected(e, route):
+                            raise
+                        r.release()
+                        r = None
+                        await self._relogin(token)
+                        r = await self._send('GET', url, event, headers=self.headers,
+                                             ssl=None if verify else False)
+                        if r.status != 200:
+                            self._raise_for_body(r.status, await r.read())
+                async for item in self._iter_items(r, key):
+                    yield item
+                next_page = r.links.get('next')
+                url = urljoin(url, str(next_page['url'])) if next_page else None
+            except Exception as e:
+                if event is not None:
+                    event.error = e
+                raise
+            finally:
+                if r is not None:
+                    r.release()
+                if event is not None:
+                    self._emit(event)
+
+
+    async def _iter_items(self, r, key):
+        """
+        Yields the items of the list key from the response r
+
+        """
+        try:
+            import ijson
+        except ImportError:
+            ijson = None
+        if ijson is None:
+            r = self.codec.loads(await r.read())
+            if 'error' in r:
+                raise APIError(r['error'])
+            for item in r[key]:
+                yield item
+        else:
+            async for item in ijson.items(r.content, '{}.item'.format(key), use_float=True):
+                yield item
+
+
+    async def connect(self, login, password, store=None, max_age=None):
+        """
+        Connect to the API with provided login and password
+        This method will retrieve useful tokens and cookies
+
+        If store is given (see `pyquanta.session`), the session saved in it is
+        reused if it is not expired, and the new session is saved to it
+        otherwise. max_age bounds the lifetime of saved sessions in seconds.
+        The session is renewed transparently if the API rejects it.
+
+        """
+        self._credentials = (login, password)
+        self.session_store = store
+        self.session_max_age = max_age
+        if store is not None and self.load_session(store):
+            self.logger.debug("Reusing saved session with token: {}".format(self.token))
+            return
+        await self._login(login, password)
+        if store is not None:
+            self.save_session(store)
+
+
+    async def _login(self, login, password):
+        """
+        Run the login handshake to get a CSRF token and session cookies
+
+        """
+        payload = {"user": {"email": login, "password": password}}
+        body = await self._get("/users/login.json", jsonify=False)
+        self._set_token(str(self.codec.loads(body).pop("csrf_token")))
+
+        body = await self._post("/users/login", payload, jsonify=False)
+        self._set_token(str(self.codec.loads(body).pop("csrf_token")))
+        self.logger.debug("Successfully connected with token: {}".format(self.token))
+
+
+    async def _relogin(self, token):
+        """
+        Renew the session rejected while token was in use, unless another
+        task already did
+
+        """
+        if self._async_login_lock is None:
+            self._async_login_lock = asyncio.Lock()
+        async with self._async_login_lock:
+            if self.token != token:
+                return
+            self.logger.debug("Session rejected, logging in again")
+            await self._login(*self._credentials)
+            if self.session_store is not None:
+                self.save_session(self.session_store)
+
+
+    def _export_cookies(self):
+        cookies = []
+        for morsel in self._get_session().cookie_jar:
+            expires = None
+            if morsel['expires']:
+                expires = parsedate_to_datetime(morsel['expires']).timestamp()
+            cookies.append({
+                'name': morsel.key,
+                'value': morsel.value,
+                'domain': morsel['domain'],
+                'path': morsel['path'] or '/',
+                'expires': expires,
+                'secure': bool(morsel['secure']),
+            })
+        return cookies
+
+
+    def _import_cookies(self, cookies):
+        from yarl import URL
+        jar = self._get_session().cookie_jar
+        for cookie in cookies:
+            morsels = SimpleCookie()
+            morsels[cookie['name']] = cookie['value']
+            morsel = morsels[cookie['name']]
+            morsel['path'] = cookie.get('path', '/')
+            if cookie.get('domain'):
+                morsel['domain'] = cookie['domain']
+            if cookie.get('expires') is not None:
+                morsel['expires'] = formatdate(cookie['expires'], usegmt=True)
+            if cookie.get('secure'):
+                morsel['secure'] = True
+            jar.update_cookies(morsels, URL(self.url))
+
+
+    @property
+    def cookies(self):
+        """
+        Returns the cookies of the current session
+
+        """
+        return self._get_session().cookie_jar
+
+
+    @property
+    def pool_stats(self):
+        """
+        Returns connection pool counters: requests sent, connections opened and
+        connections reused
+
+        """
+        return dict(self._stats)
+
+
+    async def close(self):
+        """
+        Close the session and every pooled connection, once the pending
+        snapshot refreshes are done
+
+        """
+        if self._refreshes:
+            await asyncio.gather(*self._refreshes, return_exceptions=True)
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, *exc):
+        await self.close()
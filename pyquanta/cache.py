@@ -0,0 +1,199 @@
+"""
+This module contains the response cache used by Quanta for read-only requests
+
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache(object):
+    """
+    A TTL and LRU cache of parsed API responses keyed by route
+
+    Entries expire after their TTL and the least recently used ones are evicted
+    when the cached responses exceed max_size bytes. Cached responses are shared
+    between callers and must be treated as read-only.
+
+    """
+
+    def __init__(self, ttl=30, max_size=16 * 1024 * 1024):
+        """
+        Initialize the cache, ttl being the default number of seconds a
+        response is kept and max_size the memory cap in bytes
+
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, route):
+        """
+        Returns the cached response for route or None
+
+        """
+        with self._lock:
+            entry = self._entries.get(route)
+            if entry is not None and entry[0] < time.time():
+                self._remove(route)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(route)
+            self.hits += 1
+            return entry[2]
+
+
+    def set(self, route, response, size, ttl=None):
+        """
+        Cache response for route, size being its size in bytes and ttl its
+        lifetime in seconds (the cache default if None)
+
+        """
+        if ttl is None:
+            ttl = self.ttl
+        if ttl <= 0 or size > self.max_size:
+            return
+        with self._lock:
+            self._remove(route)
+            self._entries[route] = (time.time() + ttl, size, response)
+            self.size += size
+            while self.size > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+
+    def invalidate(self, route):
+        """
+        Drop the responses cached for route, the routes below it and the
+        collection route it belongs to
+
+        """
+        parent = route.rsplit('/', 1)[0]
+        with self._lock:
+            for key in list(self._entries):
+                if key == route or key == parent or key.startswith(route + '/'):
+                    self._remove(key)
+
+
+    def clear(self):
+        """
+        Drop every cached response
+
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+    def _remove(self, route):
+        entry = self._entries.pop(route, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+
+    @property
+    def stats(self):
+        """
+        Returns hit/miss counters and the current usage of the cache
+
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': float(self.hits) / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'size': self.size,
+        }
+
+
+
+class ValidatorStore(object):
+    """
+    An LRU store of the ETag/Last-Modified validators of GET responses with
+    their parsed body, used to revalidate responses with conditional requests
+
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.revalidated = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, route):
+        """
+        Returns the (etag, last_modified, response, size) entry of route or None
+
+        """
+        with self._lock:
+            entry = self._entries.get(route)
+            if entry is not None:
+                self._entries.move_to_end(route)
+            return entry
+
+
+    def conditional_headers(self, entry):
+        """
+        Returns the headers revalidating the response of entry
+
+        """
+        headers = {}
+        if entry is not None:
+            if entry[0] is not None:
+                headers['If-None-Match'] = entry[0]
+            if entry[1] is not None:
+                headers['If-Modified-Since'] = entry[1]
+        return headers
+
+
+    def set(self, route, headers, response, size):
+        """
+        Store the validators found in the response headers of route with its
+        parsed response
+
+        """
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        with self._lock:
+            if etag is None and last_modified is None:
+                self._entries.pop(route, None)
+                return
+            self._entries[route] = (etag, last_modified, response, size)
+            self._entries.move_to_end(route)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+    def not_modified(self, entry):
+        """
+        Returns the response of entry once the server confirmed it is still
+        valid
+
+        """
+        with self._lock:
+            self.revalidated += 1
+        return entry[2]
+
+
+    def invalidate(self, route):
+        """
+        Drop the validators of route, the routes below it and the collection
+        route it belongs to
+
+        """
+        parent = route.rsplit('/', 1)[0]
+        with self._lock:
+            for key in list(self._entries):
+                if key == route or key == parent or key.startswith(route + '/'):
+                    del self._entries[key]
@@ -0,0 +1,42 @@
+"""
+This module contains the entry point of the pyquanta command, dispatching its
+subcommands to the modules implementing them
+
+    pyquanta apply jobfile.yaml
+    pyquanta export -o inventory.ndjson
+
+"""
+import sys
+
+COMMANDS = {
+    'apply': ('jobs', 'apply the operations of a job file'),
+    'export': ('export', 'export the resources of every site'),
+}
+
+
+def usage():
+    lines = ['usage: pyquanta <command> [options]', '', 'commands:']
+    lines += ['  {:<8} {}'.format(name, help) for name, (_, help) in sorted(COMMANDS.items())]
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    """
+    Entry point of the pyquanta command
+
+    """
+    from importlib import import_module
+
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0 if argv else 2
+    if argv[0] not in COMMANDS:
+        print('pyquanta: unknown command {!r}\n\n{}'.format(argv[0], usage()), file=sys.stderr)
+        return 2
+    module = import_module('.' + COMMANDS[argv[0]][0], __package__)
+    return module.main(argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
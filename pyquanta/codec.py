@@ -0,0 +1,99 @@
+"""
+This module contains the JSON codecs used to encode request bodies and decode
+responses
+
+The fastest installed library among orjson, ujson and the standard json module
+is used by default.
+
+"""
+import json
+
+
+class JsonCodec(object):
+    """
+    A codec using the standard json module
+
+    """
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj)
+
+
+    def loads(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+
+
+class OrjsonCodec(object):
+    """
+    A codec using orjson
+
+    """
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._dumps = orjson.dumps
+        self._loads = orjson.loads
+
+
+    def dumps(self, obj):
+        return self._dumps(obj)
+
+
+    def loads(self, data):
+        return self._loads(data)
+
+
+
+class UjsonCodec(object):
+    """
+    A codec using ujson
+
+    """
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self._dumps = ujson.dumps
+        self._loads = ujson.loads
+
+
+    def dumps(self, obj):
+        return self._dumps(obj)
+
+
+    def loads(self, data):
+        return self._loads(data)
+
+
+
+CODECS = (OrjsonCodec, UjsonCodec, JsonCodec)
+
+
+def get_codec(name=None):
+    """
+    Returns a codec instance: the one called name if given, the fastest
+    installed one otherwise
+
+    """
+    for klass in CODECS:
+        if name is not None and klass.name != name:
+            continue
+        try:
+            return klass()
+        except ImportError:
+            if name is not None:
+                raise
+    raise ValueError('Unknown JSON codec: {}'.format(name))
+
+
+def pretty(obj):
+    """
+    Returns obj as indented JSON, for debug logs
+
+    """
+    return json.dumps(obj, indent=2)
@@ -16,11 +16,12 @@ class APIError(Exception):
     A class to handle API errors
 
     """
-    def __init__(self, error):
+    def __init__(self, error, status_code=None):
         if isinstance(error, dict):
             msg = self._format_error_message(error)
         else:
             msg = error
+        self.status_code = status_code
         super(APIError, self).__init__(msg)
 
 
@@ -0,0 +1,348 @@
+"""
+This module contains the inventory export: it walks organizations, their sites
+and the resources of each site, streaming one NDJSON or CSV row per resource
+
+    with open('inventory.ndjson', 'w') as out:
+        export(quanta, out)
+
+Sites are fetched concurrently but written one after the other, so that an
+interrupted export can be resumed from a checkpoint file recording the sites
+already written. Memory stays bounded by max_workers sites of buffer_size rows.
+
+The `pyquanta-export` command runs it from the command line.
+
+"""
+import argparse
+import csv
+import getpass
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .exceptions import APIError
+from .resources import Scenario, Server, Endpoint, Account
+from .resources.scenario import Step
+
+RESOURCES = ('servers', 'scenarios', 'magento_monitor', 'analytics')
+ROW_TYPES = (
+    ('server', Server),
+    ('scenario', Scenario),
+    ('step', Step),
+    ('magento_endpoint', Endpoint),
+    ('analytics_account', Account),
+)
+BASE_FIELDS = ('type', 'organization_id', 'organization_name', 'site_id', 'site_name', 'parent_id', 'id')
+FIELDS = BASE_FIELDS + tuple(sorted(set(
+    attr.name for _, klass in ROW_TYPES for attr in klass.ATTRS
+    if not attr.name.startswith('_') and attr.name not in BASE_FIELDS
+)))
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+
+class CheckpointError(ValueError):
+    """
+    The output does not match the checkpoint an export is resumed from
+
+    """
+    pass
+
+
+
+class NdjsonWriter(object):
+    """
+    Writes rows as JSON objects, one per line
+
+    """
+
+    def __init__(self, out, header=True):
+        self.out = out
+
+
+    def write(self, row):
+        self.out.write(json.dumps(row, sort_keys=True))
+        self.out.write('\n')
+
+
+
+class CsvWriter(object):
+    """
+    Writes rows as CSV with the columns of FIELDS, the header being written
+    first unless header is False
+
+    """
+
+    def __init__(self, out, header=True):
+        self.writer = csv.DictWriter(out, FIELDS, extrasaction='ignore')
+        if header:
+            self.writer.writeheader()
+
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+
+
+WRITERS = {
+    'ndjson': NdjsonWriter,
+    'csv': CsvWriter,
+}
+
+
+class Checkpoint(object):
+    """
+    The progress of an export saved to a JSON file: the ids of the sites
+    written and the size of the output once they were
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.offset = 0
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.done = set(state.get('done', ()))
+            self.offset = state.get('offset', 0)
+
+
+    def mark(self, site_id, offset):
+        """
+        Record that site_id was written, the output being offset bytes long
+
+        """
+        self.done.add(site_id)
+        self.offset = offset
+        if self.path is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.pyquanta-export-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'done': sorted(self.done), 'offset': offset}, f)
+        os.replace(tmp, self.path)
+
+
+
+def _row(kind, org, site, obj, parent_id=None):
+    row = {
+        'type': kind,
+        'organization_id': org.id,
+        'organization_name': getattr(org, 'name', None),
+        'site_id': site.id,
+        'site_name': getattr(site, 'name', None),
+        'parent_id': parent_id,
+        'id': obj.id,
+    }
+    for attr in obj.ATTRS:
+        if not attr.name.startswith('_') and attr.name not in row:
+            row[attr.name] = getattr(obj, attr.name, attr.default)
+    return row
+
+
+def _get_single(klass):
+    """
+    Returns the object of a single resource, or None if the site has none
+
+    """
+    try:
+        return klass.get()
+    except APIError as e:
+        if e.status_code == 404:
+            return None
+        raise
+
+
+def iter_site_rows(quanta, org, site, resources=RESOURCES):
+    """
+    Yields the rows of the resources of site, streaming collections
+
+    """
+    scope = quanta.for_site(site.id)
+    if 'servers' in resources:
+        for server in scope.servers.iter():
+            yield _row('server', org, site, server)
+    if 'scenarios' in resources:
+        for scenario in scope.scenarios.iter():
+            yield _row('scenario', org, site, scenario)
+            for step in getattr(scenario, 'steps', ()):
+                yield _row('step', org, site, step, parent_id=scenario.id)
+    if 'magento_monitor' in resources:
+        endpoint = _get_single(scope.magento_monitor)
+        if endpoint is not None:
+            yield _row('magento_endpoint', org, site, endpoint)
+    if 'analytics' in resources:
+        account = _get_single(scope.analytics)
+        if account is not None:
+            yield _row('analytics_account', org, site, account)
+
+
+def iter_sites(quanta, site_ids=None):
+    """
+    Yields the (organization, site) pairs of the organizations of the account,
+    each site once, restricted to site_ids if given
+
+    """
+    seen = set()
+    for org in quanta.organizations.iter():
+        for site in getattr(org, 'sites', ()):
+            if site.id in seen or (site_ids is not None and site.id not in site_ids):
+                continue
+            seen.add(site.id)
+            yield org, site
+
+
+def _put(rows, row, cancelled):
+    """
+    Put row in the rows queue, waiting for room unless the export is cancelled
+
+    """
+    while not cancelled.is_set():
+        try:
+            rows.put(row, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+    raise ExportCancelled()
+
+
+def _fetch_site(quanta, org, site, resources, rows, cancelled):
+    """
+    Put the rows of site in the rows queue, followed by None
+
+    """
+    try:
+        for row in iter_site_rows(quanta, org, site, resources):
+            _put(rows, row, cancelled)
+    finally:
+        if not cancelled.is_set():
+            _put(rows, None, cancelled)
+
+
+def export(quanta, out, format='ndjson', resources=RESOURCES, site_ids=None, max_workers=4,
+           buffer_size=1000, checkpoint=None):
+    """
+    Write the rows of every resource of the sites of the account to out, a
+    text file, and returns the number of rows written
+
+    checkpoint is the path of a checkpoint file: sites it records are skipped
+    and out, if seekable, is truncated to the size it records so that rows of
+    a partially written site are written again only once. A CheckpointError is
+    raised if out is shorter than that size, as it is not the output the
+    checkpoint was recorded for.
+
+    """
+    progress = Checkpoint(checkpoint)
+    if progress.offset and out.seekable():
+        size = out.seek(0, os.SEEK_END)
+        if size < progress.offset:
+            raise CheckpointError('Cannot resume: the output is {} bytes long but the checkpoint recorded {} '
+                             'bytes, remove the checkpoint to export again'.format(size, progress.offset))
+        out.seek(progress.offset)
+        out.truncate()
+    # Outputs that cannot be seeked record no offset, the sites done tell if
+    # the header was written
+    writer = WRITERS[format](out, header=not progress.done)
+    sites = (pair for pair in iter_sites(quanta, site_ids) if pair[1].id not in progress.done)
+    cancelled = threading.Event()
+    pending = deque()
+    count = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def start_next():
+            for org, site in sites:
+                rows = queue.Queue(maxsize=buffer_size)
+                future = executor.submit(_fetch_site, quanta, org, site, resources, rows, cancelled)
+                pending.append((site, rows, future))
+                return
+
+        try:
+            for _ in range(max_workers):
+                start_next()
+            while pending:
+                site, rows, future = pending.popleft()
+                for row in iter(rows.get, None):
+                    writer.write(row)
+                    count += 1
+                future.result()
+                out.flush()
+                progress.mark(site.id, out.tell() if out.seekable() else 0)
+                quanta.logger.info("Exported site {}".format(site.id))
+                start_next()
+        except BaseException:
+            cancelled.set()
+            raise
+    return count
+
+
+def main(argv=None):
+    """
+    Entry point of the pyquanta-export command
+
+    """
+    from . import Quanta
+    from .session import FileSessionStore
+
+    parser = argparse.ArgumentParser(
+        prog='pyquanta-export',
+        description='Export the servers, scenarios, steps, Magento endpoints and analytics '
+                    'accounts of every site as NDJSON or CSV',
+    )
+    parser.add_argument('-o', '--output', default='-', help='output file, stdout by default')
+    parser.add_argument('-f', '--format', choices=sorted(WRITERS), default='ndjson')
+    parser.add_argument('-r', '--resources', default=','.join(RESOURCES),
+                        help='comma-separated resources among {}'.format(', '.join(RESOURCES)))
+    parser.add_argument('-s', '--site', type=int, action='append', dest='sites',
+                        help='export this site only, may be repeated')
+    parser.add_argument('-c', '--checkpoint', help='checkpoint file to resume an interrupted export')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='sites fetched concurrently')
+    parser.add_argument('--url', help='API URL')
+    parser.add_argument('--login', default=os.environ.get('PYQUANTA_LOGIN'))
+    parser.add_argument('--session', help='file to save the session to and reuse it from')
+    parser.add_argument('--debug', action='store_true')
+    args = parser.parse_args(argv)
+
+    resources = [name.strip() for name in args.resources.split(',') if name.strip()]
+    unknown = set(resources) - set(RESOURCES)
+    if unknown:
+        parser.error('unknown resources: {}'.format(', '.join(sorted(unknown))))
+    if not args.login:
+        parser.error('--login or PYQUANTA_LOGIN is required')
+    if args.checkpoint and os.path.exists(args.checkpoint) and args.output != '-' \
+            and not os.path.exists(args.output):
+        parser.error('the checkpoint {} exists but not the output {}, remove the checkpoint to export '
+                     'again'.format(args.checkpoint, args.output))
+    password = os.environ.get('PYQUANTA_PASSWORD') or getpass.getpass()
+
+    quanta = Quanta(url=args.url, debug=args.debug, pool_maxsize=max(args.workers, 10))
+    quanta.connect(args.login, password, store=FileSessionStore(args.session) if args.session else None)
+    try:
+        if args.output == '-':
+            count = export(quanta, sys.stdout, args.format, resources, args.sites, args.workers,
+                           checkpoint=args.checkpoint)
+        else:
+            resume = args.checkpoint and os.path.exists(args.checkpoint) and os.path.exists(args.output)
+            mode = 'r+' if resume else 'w'
+            with open(args.output, mode, newline='') as out:
+                count = export(quanta, out, args.format, resources, args.sites, args.workers,
+                               checkpoint=args.checkpoint)
+    except CheckpointError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        quanta.close()
+    quanta.logger.info("{} rows exported".format(count))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+This module contains site-scoped views of a Quanta instance and the executor
+running calls across several sites
+
+"""
+from .parallel import run_parallel, run_parallel_async
+from .resources import Scenario, Server, Endpoint, Account
+
+
+class SiteScope(object):
+    """
+    A view of a Quanta instance whose site resources are routed to one site,
+    regardless of the current site of the instance
+
+    """
+    RESOURCES = {
+        'scenarios': Scenario,
+        'servers': Server,
+        'magento_monitor': Endpoint,
+        'analytics': Account,
+    }
+
+
+    def __init__(self, quanta, site_id):
+        self.quanta = quanta
+        self.site = site_id
+
+
+    def __getattr__(self, name):
+        """
+        Bind site resources to the scope on first access
+
+        """
+        if name not in self.RESOURCES:
+            raise AttributeError(name)
+        klass = self.quanta._bind(self.RESOURCES[name], site=self.site)
+        setattr(self, name, klass)
+        return klass
+
+
+
+class FanoutResource(object):
+    """
+    A resource accessed through a SiteFanout: calling one of its methods calls
+    it for every site
+
+    """
+
+    def __init__(self, fanout, name):
+        self.fanout = fanout
+        self.name = name
+
+
+    def __getattr__(self, method):
+        def call(*args, **kwargs):
+            return self.fanout.map(
+                lambda scope: getattr(getattr(scope, self.name), method)(*args, **kwargs)
+                )
+        return call
+
+
+
+class SiteFanout(object):
+    """
+    Runs calls for several sites on a bounded thread pool
+
+    `quanta.for_sites(ids).servers.list()` returns a ParallelResult mapping each
+    site id to its servers, errors being reported per site in its `errors`
+
+    """
+
+    def __init__(self, quanta, site_ids, max_workers=10):
+        self.quanta = quanta
+        self.scopes = [SiteScope(quanta, site_id) for site_id in site_ids]
+        self.max_workers = max_workers
+
+
+    def __getattr__(self, name):
+        if name not in SiteScope.RESOURCES:
+            raise AttributeError(name)
+        return FanoutResource(self, name)
+
+
+    def map(self, fn):
+        """
+        Call fn(scope) for the SiteScope of each site and return the results
+        keyed by site id
+
+        """
+        scopes = {scope.site: scope for scope in self.scopes}
+        return run_parallel(lambda site: fn(scopes[site]), scopes, self.max_workers)
+
+
+
+class AsyncSiteFanout(SiteFanout):
+    """
+    Runs coroutines for several sites on the event loop, with at most
+    max_workers sites in flight
+
+    """
+
+    async def map(self, fn):
+        """
+        Await fn(scope) for the SiteScope of each site and return the results
+        keyed by site id
+
+        """
+        scopes = {scope.site: scope for scope in self.scopes}
+        return await run_parallel_async(lambda site: fn(scopes[site]), scopes, self.max_workers)
@@ -0,0 +1,134 @@
+"""
+This module contains the in-memory indexes used by resource lookups such as
+`quanta.servers.find(host='web1')`
+
+"""
+import threading
+
+
+class ResourceIndex(object):
+    """
+    The objects of a collection with hash indexes on their attributes
+
+    An index on an attribute is built the first time it is queried and kept up
+    to date as objects are added, updated and removed. Objects whose value is
+    not hashable are scanned instead.
+
+    """
+
+    def __init__(self, objects=()):
+        self._objects = {}
+        self._indexes = {}
+        self._keys = {}
+        self._lock = threading.RLock()
+        for obj in objects:
+            self.add(obj)
+
+
+    def __len__(self):
+        return len(self._objects)
+
+
+    def add(self, obj):
+        """
+        Add obj to the index, replacing the object with the same id if any
+
+        """
+        with self._lock:
+            self.remove(obj.id)
+            self._objects[obj.id] = obj
+            keys = self._keys[obj.id] = {}
+            for name, index in self._indexes.items():
+                keys[name] = self._index_value(index, obj, name)
+
+
+    def update(self, obj):
+        """
+        Index obj again after its attributes changed
+
+        """
+        self.add(obj)
+
+
+    def remove(self, id):
+        """
+        Remove the object with id from the index, if any
+
+        """
+        with self._lock:
+            if self._objects.pop(id, None) is None:
+                return
+            for name, key in self._keys.pop(id).items():
+                ids = self._indexes[name].get(key)
+                if ids is not None:
+                    ids.discard(id)
+                    if not ids:
+                        del self._indexes[name][key]
+
+
+    def where(self, **criteria):
+        """
+        Returns the objects whose attributes equal criteria
+
+        """
+        with self._lock:
+            ids = None
+            for name, value in criteria.items():
+                matches = self._lookup(name, value)
+                ids = matches if ids is None else ids & matches
+                if not ids:
+                    return []
+            if ids is None:
+                return list(self._objects.values())
+            return [self._objects[id] for id in sorted(ids)]
+
+
+    def find(self, **criteria):
+        """
+        Returns the first object whose attributes equal criteria, or None
+
+        """
+        objects = self.where(**criteria)
+        return objects[0] if objects else None
+
+
+    def _lookup(self, name, value):
+        """
+        Returns the set of ids of the objects whose attribute name equals value
+
+        """
+        index = self._indexes.get(name)
+        if index is None:
+            index = self._indexes[name] = {}
+            for id, obj in self._objects.items():
+                self._keys[id][name] = self._index_value(index, obj, name)
+        try:
+            ids = set(index.get(value, ()))
+        except TypeError:
+            ids = set()
+        for id in index.get(_Unhashable, ()):
+            if getattr(self._objects[id], name, None) == value:
+                ids.add(id)
+        return ids
+
+
+    def _index_value(self, index, obj, name):
+        """
+        Add obj to index under its value of name and returns the key used
+
+        """
+        key = getattr(obj, name, None)
+        try:
+            index.setdefault(key, set()).add(obj.id)
+        except TypeError:
+            key = _Unhashable
+            index.setdefault(key, set()).add(obj.id)
+        return key
+
+
+
+class _Unhashable(object):
+    """
+    The index key of objects whose value is not hashable
+
+    """
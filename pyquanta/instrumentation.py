@@ -0,0 +1,201 @@
+"""
+This module contains request instrumentation: the events emitted for each
+request and built-in observers exporting them
+
+Observers are callables taking a RequestEvent, registered with
+`Quanta.add_observer`.
+
+"""
+import re
+import threading
+import time
+
+SITE_RE = re.compile(r'^/sites/\d+')
+ID_RE = re.compile(r'/\d+(?=/|$)')
+
+
+def route_template(route):
+    """
+    Returns the template of route, ids being replaced by placeholders:
+    /sites/42/websc/scenarios/7 becomes /sites/{site}/websc/scenarios/{id}
+
+    """
+    return ID_RE.sub('/{id}', SITE_RE.sub('/sites/{site}', route.split('?')[0]))
+
+
+
+class RequestEvent(object):
+    """
+    The measurements of one request
+
+    Timings are in seconds: duration is the total time spent in the request
+    including retries, dns and connect (including TLS) the time spent
+    establishing a new connection when known, ttfb the time until the response
+    headers were received and transfer the time spent reading the body for the
+    last attempt. Unknown values are None.
+
+    """
+    __slots__ = (
+        'method', 'route', 'route_template', 'start', 'duration', 'status',
+        'dns', 'connect', 'ttfb', 'transfer', 'bytes_out', 'bytes_in',
+        'retries', 'cache_hit', 'coalesced', 'error', '_sent', '_dns_start', '_connect_start',
+    )
+
+    def __init__(self, method, route):
+        self.method = method
+        self.route = route
+        self.route_template = route_template(route)
+        self.start = time.time()
+        self.duration = None
+        self.status = None
+        self.dns = None
+        self.connect = None
+        self.ttfb = None
+        self.transfer = None
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.retries = 0
+        self.cache_hit = False
+        self.coalesced = False
+        self.error = None
+
+
+    def finish(self):
+        self.duration = time.time() - self.start
+
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if not name.startswith('_')}
+
+
+
+class PrometheusCollector(object):
+    """
+    An observer aggregating request events in Prometheus histograms and
+    counters, exposed in the text format by `render`
+
+    """
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=BUCKETS, prefix='pyquanta'):
+        self.buckets = tuple(sorted(buckets))
+        self.prefix = prefix
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+
+    def __call__(self, event):
+        labels = (
+            ('method', event.method),
+            ('route', event.route_template),
+            ('status', str(event.status) if event.status is not None else 'error'),
+        )
+        with self._lock:
+            histogram = self._histograms.get(labels)
+            if histogram is None:
+                histogram = self._histograms[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if event.duration <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += event.duration
+            histogram[2] += 1
+            self._count('bytes_sent_total', labels[:2], event.bytes_out or 0)
+            self._count('bytes_received_total', labels[:2], event.bytes_in or 0)
+            self._count('retries_total', labels[:2], event.retries)
+            self._count('cache_hits_total', labels[:2], 1 if event.cache_hit else 0)
+            self._count('coalesced_total', labels[:2], 1 if event.coalesced else 0)
+
+
+    def _count(self, name, labels, value):
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+
+    def _format_labels(self, labels):
+        return ','.join('{}="{}"'.format(name, value.replace('"', '\\"')) for name, value in labels)
+
+
+    def render(self):
+        """
+        Returns the collected metrics in the Prometheus text format
+
+        """
+        name = '{}_request_duration_seconds'.format(self.prefix)
+        lines = [
+            '# HELP {} Duration of Quanta API requests'.format(name),
+            '# TYPE {} histogram'.format(name),
+        ]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._histograms.items()):
+                fmt = self._format_labels(labels)
+                for bound, value in zip(self.buckets, counts):
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, fmt, bound, value))
+                lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(name, fmt, count))
+                lines.append('{}_sum{{{}}} {}'.format(name, fmt, total))
+                lines.append('{}_count{{{}}} {}'.format(name, fmt, count))
+            counters = sorted(self._counters.items())
+        typed = set()
+        for (counter, labels), value in counters:
+            counter = '{}_{}'.format(self.prefix, counter)
+            if counter not in typed:
+                typed.add(counter)
+                lines.append('# TYPE {} counter'.format(counter))
+            lines.append('{}{{{}}} {}'.format(counter, self._format_labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+
+
+class OpenTelemetryEmitter(object):
+    """
+    An observer emitting an OpenTelemetry span for each request event
+
+    tracer defaults to the 'pyquanta' tracer of the global tracer provider, which
+    requires opentelemetry-api to be installed
+
+    """
+
+    def __init__(self, tracer=None):
+        if tracer is None:
+            from opentelemetry import trace
+            tracer = trace.get_tracer('pyquanta')
+        self.tracer = tracer
+
+
+    def __call__(self, event):
+        attributes = {
+            'http.request.method': event.method,
+            'url.path': event.route,
+            'http.route': event.route_template,
+            'http.request.resend_count': event.retries,
+            'http.request.body.size': event.bytes_out or 0,
+            'http.response.body.size': event.bytes_in or 0,
+            'pyquanta.cache_hit': event.cache_hit,
+            'pyquanta.coalesced': event.coalesced,
+        }
+        if event.status is not None:
+            attributes['http.response.status_code'] = event.status
+        for phase in ('dns', 'connect', 'ttfb', 'transfer'):
+            value = getattr(event, phase)
+            if value is not None:
+                attributes['pyquanta.{}'.format(phase)] = value
+        if event.error is not None:
+            attributes['error.type'] = type(event.error).__name__
+        start = int(event.start * 1e9)
+        span = self.tracer.start_span(
+            '{} {}'.format(event.method, event.route_template),
+            start_time=start,
+            attributes=attributes,
+            )
+        if event.error is not None:
+            span.record_exception(event.error)
+            self._set_error(span, event.error)
+        span.end(end_time=start + int((event.duration or 0) * 1e9))
+
+
+    def _set_error(self, span, error):
+        try:
+            from opentelemetry.trace import Status, StatusCode
+        except ImportError:
+            return
+        span.set_status(Status(StatusCode.ERROR, str(error)))
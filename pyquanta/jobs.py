@@ -0,0 +1,537 @@
+"""
+This module contains the job runner: it applies a job file describing resource
+operations, running each one as soon as the operations it depends on are done
+
+    operations:
+      - id: shop
+        resource: sites
+        data: {name: shop}
+      - id: web1
+        resource: servers
+        site: ${shop.id}
+        data: {name: web1, role: web, host: web1.example.com}
+      - resource: scenarios
+        site: ${shop.id}
+        data:
+          name: checkout
+          steps: [{name: home, no: 0, url: 'https://shop.example.com/'}]
+
+`${shop.id}` is replaced by the id of the object returned by the operation
+shop, which makes it a dependency; `depends_on` lists extra dependencies.
+Independent operations run concurrently, an operation whose dependency failed
+is skipped. Job files are YAML (requiring PyYAML) or JSON if their name ends
+with .json.
+
+The `pyquanta apply` command runs it from the command line.
+
+"""
+import argparse
+import getpass
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .fanout import SiteScope
+from .resources import Scenario, Server, Endpoint, Account, Organization, Site
+from .resources.base import SingleObject, _pluralize
+
+RESOURCES = {
+    'organizations': Organization,
+    'sites': Site,
+    'servers': Server,
+    'scenarios': Scenario,
+    'magento_monitor': Endpoint,
+    'analytics': Account,
+}
+REFERENCE_RE = re.compile(r'\$\{([\w-]+)\.(\w+)\}')
+
+
+class JobError(Exception):
+    """
+    An invalid job: unknown resource, action, attribute or operation, or a
+    dependency cycle
+
+    """
+    pass
+
+
+
+class Operation(object):
+    """
+    An operation of a job and, once run, its result, error and timings
+
+    Timings are in seconds: wait is the time spent waiting for a worker once
+    the dependencies were done, api the time spent in requests and duration
+    the total time spent running the operation
+
+    """
+    CREATE = 'create'
+    GET = 'get'
+    UPDATE = 'update'
+    DELETE = 'delete'
+
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    SKIPPED = 'skipped'
+
+    def __init__(self, id, resource, action=None, site=None, data=None, depends_on=()):
+        self.id = id
+        self.resource = resource
+        self.klass = RESOURCES.get(resource)
+        self.single = self.klass is not None and issubclass(self.klass, SingleObject)
+        self.action = action or (self.UPDATE if self.single else self.CREATE)
+        self.site = site
+        self.data = data or {}
+        self.depends_on = set(depends_on) | set(_references((site, self.data)))
+        self.status = self.PENDING
+        self.result = None
+        self.error = None
+        self.ready = None
+        self.start = None
+        self.wait = None
+        self.duration = None
+        self.api = 0.0
+        self.requests = 0
+
+
+    @classmethod
+    def from_dict(klass, spec, default_id):
+        if not isinstance(spec, dict):
+            raise JobError('operation {} is not a mapping'.format(default_id))
+        unknown = set(spec) - {'id', 'resource', 'action', 'site', 'data', 'depends_on'}
+        if unknown:
+            raise JobError('operation {} has unknown keys: {}'.format(default_id, ', '.join(sorted(unknown))))
+        depends_on = spec.get('depends_on') or ()
+        if isinstance(depends_on, str):
+            depends_on = [depends_on]
+        return klass(str(spec.get('id', default_id)), spec.get('resource'), spec.get('action'),
+                     spec.get('site'), spec.get('data'), depends_on)
+
+
+    def check(self):
+        """
+        Raise a JobError if the operation cannot be run
+
+        """
+        if self.klass is None:
+            raise JobError('operation {}: unknown resource {!r}, expected one of {}'.format(
+                self.id, self.resource, ', '.join(sorted(RESOURCES))))
+        actions = (self.GET, self.UPDATE, self.DELETE) if self.single else \
+            (self.CREATE, self.GET, self.UPDATE, self.DELETE)
+        if self.action not in actions:
+            raise JobError('operation {}: cannot {} {}'.format(self.id, self.action, self.resource))
+        if self.site is not None and self.resource not in SiteScope.RESOURCES:
+            raise JobError('operation {}: {} do not belong to a site'.format(self.id, self.resource))
+        if self.site is None and self.resource in SiteScope.RESOURCES:
+            raise JobError('operation {}: a site is required for {}'.format(self.id, self.resource))
+        if not isinstance(self.data, dict):
+            raise JobError('operation {}: data is not a mapping'.format(self.id))
+        nested = {}
+        if self.action == self.CREATE:
+            nested = {_pluralize(name): klass for name, klass in self.klass.NESTED_RESOURCES.items()}
+        self._check_attributes(self.klass, self.data, nested)
+        for plural, klass in nested.items():
+            items = self.data.get(plural, [])
+            if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                raise JobError('operation {}: {} is not a list of mappings'.format(self.id, plural))
+            for item in items:
+                self._check_attributes(klass, item)
+        if not self.single and self.action != self.CREATE and 'id' not in self.data:
+            raise JobError('operation {}: an id is required to {} {}'.format(self.id, self.action, self.resource))
+
+
+    def _check_attributes(self, klass, data, nested=()):
+        names = set(attr.name for attr in klass.ATTRS) | {'id'} | set(nested)
+        unknown = [name for name in data if name not in names]
+        if unknown:
+            # YAML reads some unquoted keys, such as no, as booleans
+            hint = '' if all(isinstance(name, str) for name in unknown) else ' (quote YAML keys such as no)'
+            raise JobError('operation {}: {} has no attribute {}{}'.format(
+                self.id, klass.__name__.lower(), ', '.join(sorted(map(str, unknown))), hint))
+
+
+    def run(self, quanta, results):
+        """
+        Run the operation, results mapping the ids of the operations it depends
+        on to their result, and returns the object it created, read or saved
+
+        """
+        site = _resolve(self.site, results)
+        data = _resolve(self.data, results)
+        if site is not None:
+            klass = getattr(quanta.for_site(site), self.resource)
+        else:
+            klass = getattr(quanta, self.resource)
+        if self.action == self.CREATE:
+            return klass.create(**data)
+        obj = klass.get() if self.single else klass.get(data.pop('id'))
+        if self.action == self.UPDATE:
+            for name, value in data.items():
+                setattr(obj, name, value)
+            obj.update()
+        elif self.action == self.DELETE:
+            obj.delete()
+        return obj
+
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'resource': self.resource,
+            'action': self.action,
+            'status': self.status,
+            'object_id': getattr(self.result, 'id', None),
+            'error': str(self.error) if self.error is not None else None,
+            'wait': self.wait,
+            'api': self.api,
+            'requests': self.requests,
+            'duration': self.duration,
+        }
+
+
+
+def _references(value):
+    """
+    Yields the ids of the operations referenced by value
+
+    """
+    if isinstance(value, str):
+        for match in REFERENCE_RE.finditer(value):
+            yield match.group(1)
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _references(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _references(item)
+
+
+def _resolve(value, results):
+    """
+    Returns a copy of value whose references are replaced by the attributes of
+    the results they reference, a string made of a single reference taking
+    the type of the attribute
+
+    """
+    if isinstance(value, str):
+        match = REFERENCE_RE.fullmatch(value)
+        if match is not None:
+            return _attribute(results, *match.groups())
+        return REFERENCE_RE.sub(lambda m: str(_attribute(results, *m.groups())), value)
+    if isinstance(value, dict):
+        return {key: _resolve(item, results) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_resolve(item, results) for item in value]
+    return value
+
+
+def _attribute(results, id, name):
+    try:
+        return getattr(results[id], name)
+    except AttributeError:
+        raise JobError('the result of operation {} has no attribute {}'.format(id, name))
+
+
+
+class Job(object):
+    """
+    A graph of operations, each one depending on the operations it references
+
+    """
+
+    def __init__(self, operations):
+        self.operations = operations
+        ids = set()
+        for op in operations:
+            if op.id in ids:
+                raise JobError('duplicate operation {}'.format(op.id))
+            ids.add(op.id)
+        for op in operations:
+            op.check()
+            unknown = op.depends_on - ids
+            if unknown:
+                raise JobError('operation {} depends on unknown operations: {}'.format(
+                    op.id, ', '.join(sorted(unknown))))
+        self.order = self._sort()
+
+
+    @classmethod
+    def from_dict(klass, spec):
+        if not isinstance(spec, dict) or not isinstance(spec.get('operations'), list):
+            raise JobError('a job is a mapping with a list of operations')
+        return klass([
+            Operation.from_dict(op, '{}-{}'.format(op.get('resource') if isinstance(op, dict) else 'op', n))
+            for n, op in enumerate(spec['operations'], 1)
+        ])
+
+
+    @classmethod
+    def load(klass, path):
+        """
+        Returns the job of the YAML or JSON file at path
+
+        """
+        with open(path) as f:
+            text = f.read()
+        if path.endswith('.json'):
+            try:
+                spec = json.loads(text)
+            except ValueError as e:
+                raise JobError('invalid JSON in {}: {}'.format(path, e))
+        else:
+            try:
+                import yaml
+            except ImportError:
+                raise JobError('PyYAML is required to read YAML job files, use JSON otherwise')
+            try:
+                spec = yaml.safe_load(text)
+            except yaml.YAMLError as e:
+                raise JobError('invalid YAML in {}: {}'.format(path, e))
+        return klass.from_dict(spec)
+
+
+    def _sort(self):
+        """
+        Returns the operations in dependency order, raising a JobError if
+        there is a cycle
+
+        """
+        remaining = {op.id: set(op.depends_on) for op in self.operations}
+        by_id = {op.id: op for op in self.operations}
+        ready = deque(op.id for op in self.operations if not op.depends_on)
+        order = []
+        while ready:
+            id = ready.popleft()
+            order.append(by_id[id])
+            for op in self.operations:
+                if id in remaining[op.id]:
+                    remaining[op.id].discard(id)
+                    if not remaining[op.id]:
+                        ready.append(op.id)
+        if len(order) != len(self.operations):
+            cycle = sorted(id for id, deps in remaining.items() if deps)
+            raise JobError('dependency cycle between operations {}'.format(', '.join(cycle)))
+        return order
+
+
+    def levels(self):
+        """
+        Returns the operations grouped by depth: the operations of a level only
+        depend on operations of the previous levels
+
+        """
+        depth = {}
+        for op in self.order:
+            depth[op.id] = max([depth[id] + 1 for id in op.depends_on] or [0])
+        levels = [[] for _ in range(max(depth.values()) + 1)] if depth else []
+        for op in self.order:
+            levels[depth[op.id]].append(op)
+        return levels
+
+
+    def run(self, quanta, max_workers=4):
+        """
+        Run the operations with quanta, at most max_workers at a time, and
+        returns a JobReport
+
+        """
+        by_id = {op.id: op for op in self.operations}
+        dependents = {op.id: [] for op in self.operations}
+        remaining = {}
+        for op in self.operations:
+            remaining[op.id] = set(op.depends_on)
+            for id in op.depends_on:
+                dependents[id].append(op)
+        results = {}
+        local = threading.local()
+
+        def observe(event):
+            op = getattr(local, 'operation', None)
+            if op is not None:
+                op.requests += 1
+                op.api += event.duration or 0.0
+
+        def execute(op):
+            local.operation = op
+            op.start = time.time()
+            op.wait = op.start - op.ready
+            try:
+                op.result = results[op.id] = op.run(quanta, results)
+                op.status = Operation.DONE
+            except Exception as e:
+                op.error = e
+                op.status = Operation.FAILED
+                quanta.logger.error("Operation {} failed: {}".format(op.id, e))
+            finally:
+                op.duration = time.time() - op.start
+                local.operation = None
+
+        def skip(op, cause):
+            op.status = Operation.SKIPPED
+            op.error = JobError('operation {} did not succeed'.format(cause))
+            for dependent in dependents[op.id]:
+                if dependent.status == Operation.PENDING:
+                    skip(dependent, op.id)
+
+        start = time.time()
+        quanta.add_observer(observe)
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                running = {}
+
+                def submit(op):
+                    op.ready = time.time()
+                    running[executor.submit(execute, op)] = op
+
+                for op in self.order:
+                    if not op.depends_on:
+                        submit(op)
+                while running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        op = running.pop(future)
+                        for dependent in dependents[op.id]:
+                            if dependent.status != Operation.PENDING:
+                                continue
+                            if op.status != Operation.DONE:
+                                skip(dependent, op.id)
+                                continue
+                            remaining[dependent.id].discard(op.id)
+                            if not remaining[dependent.id]:
+                                submit(dependent)
+        finally:
+            quanta.remove_observer(observe)
+        return JobReport([by_id[op.id] for op in self.operations], time.time() - start)
+
+
+
+class JobReport(object):
+    """
+    The outcome and timings of the operations of a job run
+
+    """
+
+    def __init__(self, operations, elapsed):
+        self.operations = operations
+        self.elapsed = elapsed
+
+
+    @property
+    def failed(self):
+        return [op for op in self.operations if op.status != Operation.DONE]
+
+
+    @property
+    def critical_path(self):
+        """
+        Returns the longest time spent running a chain of dependent operations,
+        the shortest time the job could take with unbounded parallelism
+
+        """
+        by_id = {op.id: op for op in self.operations}
+        totals = {}
+
+        def total(op):
+            if op.id not in totals:
+                totals[op.id] = (op.duration or 0.0) + max([total(by_id[id]) for id in op.depends_on] or [0.0])
+            return totals[op.id]
+
+        return max([total(op) for op in self.operations] or [0.0])
+
+
+    def as_dict(self):
+        return {
+            'elapsed': self.elapsed,
+            'critical_path': self.critical_path,
+            'operations': [op.as_dict() for op in self.operations],
+        }
+
+
+    def format(self):
+        """
+        Returns the report as a table with a line per operation, timings being
+        in milliseconds
+
+        """
+        def ms(value):
+            return '-' if value is None else '{:.1f}'.format(value * 1000)
+
+        width = max([len(op.id) for op in self.operations] + [len('operation')])
+        line = '{:<%d}  {:<16} {:<7} {:<8} {:>5} {:>9} {:>9} {:>9}  {}' % width
+        lines = [line.format('operation', 'resource', 'action', 'status', 'reqs', 'wait ms', 'api ms',
+                             'total ms', 'result')]
+        for op in self.operations:
+            if op.status == Operation.DONE:
+                outcome = 'id {}'.format(getattr(op.result, 'id', None))
+            else:
+                outcome = str(op.error) if op.error is not None else ''
+            api = op.api if op.start is not None else None
+            lines.append(line.format(op.id, op.resource, op.action, op.status, op.requests, ms(op.wait),
+                                     ms(api), ms(op.duration), outcome))
+        counts = {}
+        for op in self.operations:
+            counts[op.status] = counts.get(op.status, 0) + 1
+        lines.append('{} operations in {:.2f}s (critical path {:.2f}s): {}'.format(
+            len(self.operations), self.elapsed, self.critical_path,
+            ', '.join('{} {}'.format(count, status) for status, count in sorted(counts.items()))))
+        return '\n'.join(lines)
+
+
+def main(argv=None):
+    """
+    Entry point of the pyquanta apply command
+
+    """
+    from . import Quanta
+    from .session import FileSessionStore
+
+    parser = argparse.ArgumentParser(
+        prog='pyquanta apply',
+        description='Apply the operations of a job file, running independent operations concurrently',
+    )
+    parser.add_argument('jobfile', help='YAML or JSON job file')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='operations run concurrently')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='print the operations in dependency order without running them')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--url', help='API URL')
+    parser.add_argument('--login', default=os.environ.get('PYQUANTA_LOGIN'))
+    parser.add_argument('--session', help='file to save the session to and reuse it from')
+    parser.add_argument('--debug', action='store_true')
+    args = parser.parse_args(argv)
+
+    try:
+        job = Job.load(args.jobfile)
+    except (IOError, OSError, JobError) as e:
+        parser.error(str(e))
+    if args.dry_run:
+        for n, level in enumerate(job.levels()):
+            for op in level:
+                depends = ' after {}'.format(', '.join(sorted(op.depends_on))) if op.depends_on else ''
+                print('{} {} {} {}{}'.format(n, op.id, op.action, op.resource, depends))
+        return 0
+    if not args.login:
+        parser.error('--login or PYQUANTA_LOGIN is required')
+    password = os.environ.get('PYQUANTA_PASSWORD') or getpass.getpass()
+
+    quanta = Quanta(url=args.url, debug=args.debug, pool_maxsize=max(args.workers, 10))
+    quanta.connect(args.login, password, store=FileSessionStore(args.session) if args.session else None)
+    try:
+        report = job.run(quanta, args.workers)
+    finally:
+        quanta.close()
+    if args.json:
+        print(json.dumps(report.as_dict(), indent=2))
+    else:
+        print(report.format())
+    return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
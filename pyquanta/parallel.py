@@ -0,0 +1,78 @@
+"""
+This module contains helpers to run API calls concurrently
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ParallelResult(dict):
+    """
+    The results of concurrent calls keyed by item, failed calls are stored in
+    `errors` with the exception they raised
+
+    """
+
+    def __init__(self):
+        super(ParallelResult, self).__init__()
+        self.errors = {}
+
+
+    @property
+    def ok(self):
+        """
+        True if no call failed
+
+        """
+        return not self.errors
+
+
+    def raise_for_errors(self):
+        """
+        Raise the first error if some calls failed
+
+        """
+        for error in self.errors.values():
+            raise error
+
+
+
+def run_parallel(fn, keys, max_workers=10):
+    """
+    Call fn(key) for each key on a bounded thread pool and return a
+    ParallelResult keyed by key
+
+    """
+    result = ParallelResult()
+    keys = list(keys)
+    if not keys:
+        return result
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(keys))) as executor:
+        futures = [(key, executor.submit(fn, key)) for key in keys]
+        for key, future in futures:
+            try:
+                result[key] = future.result()
+            except Exception as e:
+                result.errors[key] = e
+    return result
+
+
+async def run_parallel_async(fn, keys, max_workers=10):
+    """
+    Await fn(key) for each key with at most max_workers calls in flight and
+    return a ParallelResult keyed by key
+
+    """
+    import asyncio
+
+    result = ParallelResult()
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def run(key):
+        async with semaphore:
+            try:
+                result[key] = await fn(key)
+            except Exception as e:
+                result.errors[key] = e
+
+    await asyncio.gather(*[run(key) for key in keys])
+    return result
@@ -0,0 +1,87 @@
+"""
+This module contains the HTTP connection pooling used by Quanta
+
+"""
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+
+
+class PooledAdapter(HTTPAdapter):
+    """
+    An HTTP adapter keeping persistent connections to the API and counting
+    how often they are reused
+
+    """
+
+    def __init__(self, keep_alive=None, **kwargs):
+        """
+        Initialize the adapter, keep_alive being the number of seconds an idle
+        connection is kept in the pool (None to keep it forever)
+
+        """
+        self.keep_alive = keep_alive
+        self._last_used = None
+        self._closed_stats = {'requests': 0, 'connections': 0}
+        self._lock = threading.RLock()
+        super(PooledAdapter, self).__init__(**kwargs)
+
+
+    def send(self, request, **kwargs):
+        """
+        Send a request, dropping idle connections first if they are older than
+        the keep-alive timeout
+
+        The pool manager is safe for concurrent use, so one adapter is shared
+        by every thread sending requests through the client
+
+        """
+        now = time.time()
+        with self._lock:
+            if (self.keep_alive is not None and self._last_used is not None
+                    and now - self._last_used > self.keep_alive):
+                self.close()
+            self._last_used = now
+        return super(PooledAdapter, self).send(request, **kwargs)
+
+
+    def close(self):
+        """
+        Close every pooled connection, keeping track of their counters
+
+        """
+        with self._lock:
+            for key, value in self._pool_stats().items():
+                self._closed_stats[key] += value
+            super(PooledAdapter, self).close()
+
+
+    def _pool_stats(self):
+        """
+        Returns the counters of the currently opened pools
+
+        """
+        stats = {'requests': 0, 'connections': 0}
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats['requests'] += pool.num_requests
+            stats['connections'] += pool.num_connections
+        return stats
+
+
+    @property
+    def stats(self):
+        """
+        Returns the number of requests sent, connections opened and connections
+        reused since the adapter was created
+
+        """
+        stats = self._pool_stats()
+        for key, value in self._closed_stats.items():
+            stats[key] += value
+        stats['reused'] = max(stats['requests'] - stats['connections'], 0)
+        return stats
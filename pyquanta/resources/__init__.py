@@ -11,14 +11,60 @@ from .analytics import Account
 from .organization import Organization
 from .site import Site
 
-def get_obj_class(klass, _quanta, _logger):
+def get_obj_class(klass, _quanta, _logger, mixin=None, _site=None):
     """
     A closure to retrieve a class from a base klass using quanta as an internal
     Quanta object for the newly created class
 
+    If mixin is given, its methods take precedence over the ones of klass and if
+    _site is given, the class routes its calls to this site instead of the
+    current site of quanta
+
+    Classes are cached in the `_obj_classes` dict of quanta if it has one, so
+    binding the same resource twice returns the same class
+
     """
-    class QuantaObj(klass):
-        quanta = _quanta
-        logger = _logger
+    cache = getattr(_quanta, '_obj_classes', None)
+    key = (klass, _logger, mixin, _site)
+    if cache is not None and key in cache:
+        return cache[key]
 
+    if mixin is not None:
+        class QuantaObj(mixin, klass):
+            quanta = _quanta
+            logger = _logger
+            site = _site
+    else:
+        class QuantaObj(klass):
+            quanta = _quanta
+            logger = _logger
+            site = _site
+
+    if cache is not None:
+        QuantaObj = cache.setdefault(key, QuantaObj)
     return QuantaObj
+
+
+
+class BoundResource(object):
+    """
+    A descriptor binding the resource klass to the Quanta instance it is read
+    from, on first access only: the bound class is then stored on the instance
+
+    """
+
+    def __init__(self, klass):
+        self.klass = klass
+        self.name = None
+
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+
+    def __get__(self, quanta, owner):
+        if quanta is None:
+            return self
+        klass = quanta._bind(self.klass)
+        quanta.__dict__[self.name] = klass
+        return klass
@@ -0,0 +1,262 @@
+"""
+This module contains the asyncio counterparts of the resource base classes
+
+They are used as mixins on top of the resource classes by AsyncQuanta, so the
+resources definitions are shared with the blocking client.
+Nested objects need no counterpart: their methods return the result of their
+parent update, which is a coroutine on an asynchronous resource.
+
+"""
+from contextlib import asynccontextmanager
+
+from ..exceptions import APIError, AttrError
+from ..index import ResourceIndex
+from ..parallel import run_parallel_async
+from .base import JsonObject
+
+
+class AsyncBaseObject(object):
+    """
+    Asynchronous versions of the BaseObject methods
+
+    """
+    __slots__ = ()
+
+    @classmethod
+    async def get(klass, id):
+        """
+        Retrieves a object from quanta API and returns an instance
+
+        """
+        r = await klass.quanta._get(klass.get_route(id), ttl=klass.CACHE_TTL)
+        return klass._load(r[klass.DICT_KEY])
+
+
+    @classmethod
+    async def create(klass, **kwargs):
+        """
+        Create an object instance and save it to the API
+
+        """
+        obj = klass(**kwargs)
+        r = await klass.quanta._post(klass.get_route(), data={klass.DICT_KEY: obj.as_dict()})
+        obj = klass._load(r[klass.DICT_KEY])
+        klass._reindex(obj)
+        return obj
+
+
+    @classmethod
+    async def list(klass, lazy=False):
+        """
+        Retrieves and returns a list of objects, as stubs if lazy is True
+
+        """
+        r = await klass.quanta._get(klass.get_route(), ttl=klass.CACHE_TTL)
+        return list(map(klass._load_lazy if lazy else klass._load, r[klass.DICT_KEY + 's']))
+
+
+    @classmethod
+    async def all(klass, *args, **kwargs):
+        """
+        Alias for `list`
+
+        """
+        return await klass.list(*args, **kwargs)
+
+
+    @classmethod
+    async def iter(klass, lazy=False):
+        """
+        Retrieves objects and yields them one at a time, following pagination,
+        without loading the whole collection in memory, as stubs if lazy is True
+
+        """
+        load = klass._load_lazy if lazy else klass._load
+        async for data in klass.quanta._stream(klass.get_route(), klass.DICT_KEY + 's'):
+            yield load(data)
+
+
+    async def hydrate(self):
+        """
+        Fetch the object if it is a stub built from an incomplete payload, so
+        that every attribute can be read, and returns it
+
+        """
+        if getattr(self, '_full', True):
+            return self
+        r = await self.quanta._get(self.get_route(self.id), ttl=self.CACHE_TTL)
+        self._merge_raw(r[self.DICT_KEY])
+        return self
+
+
+    def _fetch_missing(self, name):
+        """
+        Attributes are read synchronously, so stubs cannot fetch themselves
+
+        """
+        raise AttrError("{} {} was listed without {}, await its hydrate() first".format(
+            self.DICT_KEY, self.id, name))
+
+
+    @classmethod
+    def stream(klass, *args, **kwargs):
+        """
+        Alias for `iter`
+
+        """
+        return klass.iter(*args, **kwargs)
+
+
+    @classmethod
+    async def where(klass, **criteria):
+        """
+        Returns the objects whose attributes equal criteria, using the indexes
+        of the collection
+
+        """
+        return (await klass._get_index(criteria)).where(**criteria)
+
+
+    @classmethod
+    async def find(klass, **criteria):
+        """
+        Returns the first object whose attributes equal criteria, or None
+
+        """
+        return (await klass._get_index(criteria)).find(**criteria)
+
+
+    @classmethod
+    async def _get_index(klass, criteria):
+        """
+        Returns the index of the collection, fetching it if needed
+
+        """
+        klass._check_criteria(criteria)
+        route = klass.get_route()
+        index = klass.quanta._indexes.get(route)
+        if index is None:
+            objects = await klass.list()
+            index = klass.quanta._indexes.setdefault(route, ResourceIndex(objects))
+        return index
+
+
+    @classmethod
+    async def bulk_create(klass, items, max_workers=10):
+        """
+        Create an object for each dict of items, with at most max_workers
+        requests in flight
+
+        Returns a ParallelResult mapping the index of each item to the created
+        object, failed items being reported in its `errors`
+
+        """
+        items = list(items)
+        return await run_parallel_async(lambda i: klass.create(**items[i]), range(len(items)), max_workers)
+
+
+    @classmethod
+    async def bulk_update(klass, objects, max_workers=10):
+        """
+        Save each object of objects, with at most max_workers requests in
+        flight
+
+        Returns a ParallelResult mapping the index of each object to the
+        updated object, failed updates being reported in its `errors`
+
+        """
+        objects = list(objects)
+        return await run_parallel_async(
+            lambda i: klass._bulk_update_one(objects[i]), range(len(objects)), max_workers)
+
+
+    @classmethod
+    async def bulk_delete(klass, objects, max_workers=10):
+        """
+        Delete each object (or id) of objects, with at most max_workers
+        requests in flight
+
+        Returns a ParallelResult mapping the index of each object to the
+        deleted object, failed deletions being reported in its `errors`
+
+        """
+        objects = [obj if isinstance(obj, JsonObject) else klass(id=obj) for obj in objects]
+        return await run_parallel_async(
+            lambda i: klass._bulk_delete_one(objects[i]), range(len(objects)), max_workers)
+
+
+    @classmethod
+    async def _bulk_update_one(klass, obj):
+        await obj.update()
+        return obj
+
+
+    @classmethod
+    async def _bulk_delete_one(klass, obj):
+        await obj.delete()
+        return obj
+
+
+    @asynccontextmanager
+    async def batch(self):
+        """
+        A context in which updates of the object, including the ones triggered
+        by its nested objects, are deferred and sent as a single PUT when the
+        outermost batch exits without error
+
+        """
+        self._enter_batch()
+        try:
+            yield self
+        except Exception:
+            self._exit_batch(False)
+            raise
+        if self._exit_batch(True):
+            await self.update()
+
+
+    async def update(self, **kwargs):
+        if self._defer_update():
+            return
+        data = self.changes_as_dict()
+        if not data:
+            return
+        r = await self.quanta._put(self.get_route(self.id), data={self.DICT_KEY: data})
+        self.from_dict(**r[self.DICT_KEY])
+        self._mark_clean()
+        self._reindex(self)
+
+
+    async def delete(self):
+        await self.quanta._delete(self.get_route(self.id))
+        if hasattr(self, 'id'):
+            self._reindex(self, deleted_id=self.id)
+            self.id = None
+
+
+
+class AsyncSingleObject(object):
+    """
+    Asynchronous versions of the SingleObject methods
+
+    """
+    __slots__ = ()
+
+    @classmethod
+    async def get(klass):
+        r = await klass.quanta._get(klass.get_route(), ttl=klass.CACHE_TTL)
+        return klass._load(r[klass.DICT_KEY])
+
+    async def update(self, **kwargs):
+        data = self.changes_as_dict()
+        if not data:
+            return self
+        try:
+            r = await self.quanta._put(self.get_route(), data={self.DICT_KEY: data})
+            self.from_dict(**r[self.DICT_KEY])
+            self._mark_clean()
+        except APIError as e:
+            self.from_dict(**(await self.get()).as_dict())
+            self._mark_clean()
+            raise e
+        return self
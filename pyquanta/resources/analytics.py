@@ -19,4 +19,4 @@ class Account(SingleObject):
     ]
 
     def delete(self):
-        r = self.quanta._delete(self.get_route())
+        return self.quanta._delete(self.get_route())
@@ -3,7 +3,11 @@ This module contains base for implementing resource classes
 
 """
 import json
+from contextlib import contextmanager
+
 from ..exceptions import APIError, AttrError
+from ..index import ResourceIndex
+from ..parallel import run_parallel
 
 
 class Attribute(object):
@@ -18,14 +22,143 @@ class Attribute(object):
         self.default = default
 
 
-class JsonObject(object):
+def _pluralize(name):
+    return name if name[-1] == 's' else name + 's'
+
+
+COMPILED_METHODS = ('__init__', 'from_dict', '_parse_args', '_attrs_as_dict')
+
+
+class JsonObjectMeta(type):
+    """
+    The metaclass of JsonObject
+
+    It gives each class __slots__ for its attributes, nested resources and SLOTS,
+    so instances carry no __dict__, a NestedResource accessor for each nested
+    resource (e.g. `scenario.Step`), and compiles specialized __init__, from_dict,
+    _parse_args and _attrs_as_dict methods from ATTRS when one of them is first
+    called. Classes without ATTRS keep the generic JsonObject implementations.
+
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        if '__slots__' not in namespace:
+            namespace['__slots__'] = mcs._slots(bases, namespace)
+        klass = super(JsonObjectMeta, mcs).__new__(mcs, name, bases, namespace)
+        for nested, nested_klass in namespace.get('NESTED_RESOURCES', {}).items():
+            setattr(klass, nested.capitalize(), NestedResource(nested_klass, _pluralize(nested)))
+        if ('ATTRS' in namespace or 'NESTED_RESOURCES' in namespace) and klass.ATTRS:
+            mcs._defer_compile(klass)
+        return klass
+
+
+    @staticmethod
+    def _slots(bases, namespace):
+        """
+        Returns the slots needed by a class and not provided by its bases
+
+        """
+        def lookup(name):
+            if name in namespace:
+                return namespace[name]
+            for base in bases:
+                if hasattr(base, name):
+                    return getattr(base, name)
+            return ()
+
+        names = ['id'] + [attr.name for attr in lookup('ATTRS')] + list(lookup('SLOTS'))
+        names += [_pluralize(nested) for nested in lookup('NESTED_RESOURCES')]
+        taken = set()
+        for base in bases:
+            for klass in base.__mro__:
+                taken.update(klass.__dict__.get('__slots__', ()))
+        slots = []
+        for name in names:
+            if name not in taken:
+                taken.add(name)
+                slots.append(name)
+        return tuple(slots)
+
+
+    @staticmethod
+    def _defer_compile(klass):
+        """
+        Install placeholders compiling the methods of klass when one of them is
+        first called, so that importing resources does not pay for compiling
+        the ones never used
+
+        """
+        def placeholder(name):
+            def method(self, *args, **kwargs):
+                if klass.__dict__[name] is method:
+                    JsonObjectMeta._compile(klass)
+                return getattr(klass, name)(self, *args, **kwargs)
+            method.__name__ = name
+            method.__qualname__ = '{}.{}'.format(klass.__name__, name)
+            return method
+
+        for name in COMPILED_METHODS:
+            setattr(klass, name, placeholder(name))
+
+
+    @staticmethod
+    def _compile(klass):
+        """
+        Compile the methods parsing and serializing the ATTRS of klass
+
+        """
+        namespace = {'AttrError': AttrError}
+        parse = ["    pop = kwargs.pop", "    self.id = pop('id', None)"]
+        as_dict = ["    d = {}"]
+        for i, attr in enumerate(klass.ATTRS):
+            default = '_default{}'.format(i)
+            namespace[default] = attr.default
+            if attr.name != 'id':
+                parse += [
+                    "    value = pop({!r}, {})".format(attr.name, default),
+                    "    if value is not None:",
+                    "        self.{} = value".format(attr.name),
+                ]
+            as_dict += [
+                "    value = getattr(self, {!r}, {})".format(attr.name, default),
+                "    if value is not None:",
+                "        d[{!r}] = value".format(attr.name),
+            ]
+            if attr.required:
+                as_dict += [
+                    "    else:",
+                    "        raise AttrError('Attribute {} is required')".format(attr.name),
+                ]
+        as_dict += ["    if self.id is not None:", "        d['id'] = self.id", "    return d"]
+        init = parse
+        if klass.NESTED_RESOURCES:
+            init = ["    self._parse_nested_resources_args(kwargs)"] + parse
+        source = '\n'.join(
+            ["def __init__(self, **kwargs):"] + init +
+            ["def from_dict(self, **kwargs):"] + init +
+            ["def _parse_args(self, kwargs):"] + parse +
+            ["def _attrs_as_dict(self):"] + as_dict
+        )
+        exec(compile(source, '<{} attributes>'.format(klass.__name__), 'exec'), namespace)
+        for name in COMPILED_METHODS:
+            namespace[name].__qualname__ = '{}.{}'.format(klass.__name__, name)
+            setattr(klass, name, namespace[name])
+
+
+
+class JsonObject(object, metaclass=JsonObjectMeta):
     """
     This is a base class to implement jsonifiable objects
 
+    Its methods parsing and serializing ATTRS are compiled by JsonObjectMeta,
+    extra instance attributes must be declared in SLOTS
+
     """
     ATTRS = []
     NESTED_RESOURCES = {}
     NESTED_RESOURCE_DICT_KEY_FMT = '{}s_attributes'
+    SYNC_KEY = 'name'
+    SLOTS = ('_clean',)
 
 
     def __init__(self, **kwargs):
@@ -51,12 +184,9 @@ class JsonObject(object):
 
         """
         for name, klass in self._get_nested_resources().items():
-            setattr(self, name.capitalize(), klass.nest_in(self._pluralize(name), self))
-            setattr(self, self._pluralize(name), [])
-            if self._pluralize(name) in kwargs:
-                getattr(self, self._pluralize(name)).extend([
-                    getattr(self, name.capitalize())(**data) for data in kwargs.pop(self._pluralize(name))
-                ])
+            plural = self._pluralize(name)
+            factory = NestedFactory(klass, self, plural)
+            setattr(self, plural, [factory(**data) for data in kwargs.pop(plural, ())])
 
 
     def _parse_args(self, kwargs):
@@ -76,7 +206,7 @@ class JsonObject(object):
         Pluralize a string
 
         """
-        return str if str[-1] == 's' else str + 's'
+        return _pluralize(str)
 
 
     def _unpluralize(self, str):
@@ -103,9 +233,9 @@ class JsonObject(object):
         return self.ATTRS
 
 
-    def as_dict(self):
+    def _attrs_as_dict(self):
         """
-        Return the current object as a dict using self._get_attrs()
+        Return the attributes of the object as a dict using self._get_attrs()
 
         """
         d = {}
@@ -117,6 +247,15 @@ class JsonObject(object):
                 raise AttrError('Attribute {} is required'.format(attr.name))
         if self.id is not None:
             d['id'] = self.id
+        return d
+
+
+    def as_dict(self):
+        """
+        Return the current object as a dict using self._get_attrs()
+
+        """
+        d = self._attrs_as_dict()
         d.update({
             self.NESTED_RESOURCE_DICT_KEY_FMT.format(nested):
                 list(map(lambda x: x.as_dict(), getattr(self, self._pluralize(nested), [])))
@@ -125,6 +264,67 @@ class JsonObject(object):
         return d
 
 
+    @classmethod
+    def _load(klass, data):
+        """
+        Build an object from data returned by the API, changes being tracked
+        from there
+
+        """
+        obj = klass(**data)
+        obj._mark_clean()
+        return obj
+
+
+    def _mark_clean(self):
+        """
+        Record the current attribute values as the ones known by the API, for
+        the object and its nested objects
+
+        """
+        self._clean = tuple(getattr(self, attr.name, attr.default) for attr in self._get_attrs())
+        for nested in self._get_nested_resources():
+            for item in getattr(self, self._pluralize(nested), ()):
+                item._mark_clean()
+
+
+    def dirty_fields(self):
+        """
+        Returns the names of the attributes modified since the object was
+        loaded from the API, or None if it was not loaded from the API
+
+        Attributes are compared by value, so mutable values modified in place
+        are only detected if they are assigned again
+
+        """
+        clean = getattr(self, '_clean', None)
+        if clean is None:
+            return None
+        return [attr.name for attr, value in zip(self._get_attrs(), clean)
+                if getattr(self, attr.name, attr.default) != value]
+
+
+    def changes_as_dict(self):
+        """
+        Returns the attributes to send to save the object: the modified ones
+        and the modified nested objects if it was loaded from the API, as_dict()
+        otherwise. The dict is empty if nothing changed.
+
+        """
+        dirty = self.dirty_fields()
+        if dirty is None:
+            return self.as_dict()
+        d = {name: getattr(self, name, None) for name in dirty}
+        for nested in self._get_nested_resources():
+            items = [item.changes_as_dict() for item in getattr(self, self._pluralize(nested), [])]
+            items = [item for item in items if item]
+            if items:
+                d[self.NESTED_RESOURCE_DICT_KEY_FMT.format(nested)] = items
+        if d and self.id is not None:
+            d['id'] = self.id
+        return d
+
+
 
 class APIObject(JsonObject):
     """
@@ -134,6 +334,20 @@ class APIObject(JsonObject):
     BASE_ROUTE = ''
     ROUTE_SUFFIX = ''
     DICT_KEY = None
+    CACHE_TTL = None
+    site = None
+
+    @classmethod
+    def get_site_route(klass):
+        """
+        Returns the base route for the site of the class, falling back on the
+        current site of the Quanta instance
+
+        """
+        if klass.site is not None:
+            return "/sites/{}".format(klass.site)
+        return klass.quanta.site_route
+
 
     @classmethod
     def get_route(klass, id=None):
@@ -142,9 +356,9 @@ class APIObject(JsonObject):
 
         """
         if id is not None:
-            return "{}{}/{}{}".format(klass.quanta.site_route, klass.BASE_ROUTE, id, klass.ROUTE_SUFFIX)
+            return "{}{}/{}{}".format(klass.get_site_route(), klass.BASE_ROUTE, id, klass.ROUTE_SUFFIX)
         else:
-            return "{}{}{}".format(klass.quanta.site_route, klass.BASE_ROUTE, klass.ROUTE_SUFFIX)
+            return "{}{}{}".format(klass.get_site_route(), klass.BASE_ROUTE, klass.ROUTE_SUFFIX)
 
 
 
@@ -153,6 +367,7 @@ class BaseObject(APIObject):
     This is a base class to implement quanta objects
 
     """
+    SLOTS = ('_batch_depth', '_batch_pending')
 
     @classmethod
     def get(klass, id):
@@ -160,8 +375,8 @@ class BaseObject(APIObject):
         Retrieves a object from quanta API and returns an instance
 
         """
-        r = klass.quanta._get(klass.get_route(id))
-        return klass(**r[klass.DICT_KEY])
+        r = klass.quanta._get(klass.get_route(id), ttl=klass.CACHE_TTL)
+        return klass._load(r[klass.DICT_KEY])
 
 
     @classmethod
@@ -172,17 +387,22 @@ class BaseObject(APIObject):
         """
         obj = klass(**kwargs)
         r = klass.quanta._post(klass.get_route(), data={klass.DICT_KEY: obj.as_dict()})
-        return klass(**r[klass.DICT_KEY])
+        obj = klass._load(r[klass.DICT_KEY])
+        klass._reindex(obj)
+        return obj
 
 
     @classmethod
-    def list(klass):
+    def list(klass, lazy=False):
         """
         Retrieves and returns a list of hosts
 
+        If lazy is True, the objects are stubs decoding their attributes and
+        nested objects on first access, see `_load_lazy`
+
         """
-        r = klass.quanta._get(klass.get_route())
-        return list(map(lambda data: klass(**data), r[klass.DICT_KEY + 's']))
+        r = klass.quanta._get(klass.get_route(), ttl=klass.CACHE_TTL)
+        return list(map(klass._load_lazy if lazy else klass._load, r[klass.DICT_KEY + 's']))
 
 
     @classmethod
@@ -194,43 +414,433 @@ class BaseObject(APIObject):
         return klass.list(*args, **kwargs)
 
 
+    @classmethod
+    def iter(klass, lazy=False):
+        """
+        Retrieves objects and yields them one at a time, following pagination,
+        without loading the whole collection in memory, as stubs if lazy is True
+
+        """
+        load = klass._load_lazy if lazy else klass._load
+        for data in klass.quanta._stream(klass.get_route(), klass.DICT_KEY + 's'):
+            yield load(data)
+
+
+    @classmethod
+    def stream(klass, *args, **kwargs):
+        """
+        Alias for `iter`
+
+        """
+        return klass.iter(*args, **kwargs)
+
+
+    @classmethod
+    def _load_lazy(klass, data):
+        """
+        Build a stub of an object from data returned by the API: only its id
+        is set, other attributes and nested objects are decoded from data when
+        first read, and the object is fetched with `hydrate` if one is missing
+        from data, as list payloads may omit fields
+
+        """
+        lazy_klass = klass.__dict__.get('_lazy_klass')
+        if lazy_klass is None:
+            lazy_klass = LazyObject.subclass(klass)
+            klass._lazy_klass = lazy_klass
+        obj = lazy_klass.__new__(lazy_klass)
+        obj._raw = data
+        obj._full = False
+        obj.id = data.get('id')
+        return obj
+
+
+    def hydrate(self):
+        """
+        Fetch the object if it is a stub built from an incomplete payload, so
+        that every attribute can be read, and returns it
+
+        """
+        if getattr(self, '_full', True):
+            return self
+        r = self.quanta._get(self.get_route(self.id), ttl=self.CACHE_TTL)
+        self._merge_raw(r[self.DICT_KEY])
+        return self
+
+
+    def _fetch_missing(self, name):
+        """
+        Called when name is read on a stub whose payload does not have it
+
+        """
+        self.hydrate()
+
+
+    @classmethod
+    def where(klass, **criteria):
+        """
+        Returns the objects whose attributes equal criteria, e.g.
+        `quanta.scenarios.where(enabled=True, status='failed')`
+
+        Lookups use in-memory hash indexes over the collection, fetched once
+        and kept up to date by create, update and delete. Use `drop_index` to
+        fetch it again after changes made by other clients.
+
+        """
+        return klass._get_index(criteria).where(**criteria)
+
+
+    @classmethod
+    def find(klass, **criteria):
+        """
+        Returns the first object whose attributes equal criteria, or None
+
+        """
+        return klass._get_index(criteria).find(**criteria)
+
+
+    @classmethod
+    def drop_index(klass):
+        """
+        Drop the index of the collection, fetched again by the next lookup
+
+        """
+        klass.quanta._indexes.pop(klass.get_route(), None)
+
+
+    @classmethod
+    def _check_criteria(klass, criteria):
+        names = set(attr.name for attr in klass.ATTRS) | {'id'}
+        for name in criteria:
+            if name not in names:
+                raise AttrError("{} has no attribute {}".format(klass.DICT_KEY, name))
+
+
+    @classmethod
+    def _get_index(klass, criteria):
+        """
+        Returns the index of the collection, fetching it if needed
+
+        """
+        klass._check_criteria(criteria)
+        route = klass.get_route()
+        index = klass.quanta._indexes.get(route)
+        if index is None:
+            index = klass.quanta._indexes.setdefault(route, ResourceIndex(klass.list()))
+        return index
+
+
+    @classmethod
+    def _reindex(klass, obj, deleted_id=None):
+        """
+        Update the index of the collection, if any, after obj was saved or the
+        object with deleted_id was deleted
+
+        """
+        index = klass.quanta._indexes.get(klass.get_route())
+        if index is None:
+            return
+        if deleted_id is not None:
+            index.remove(deleted_id)
+        else:
+            index.update(obj)
+
+
+    @classmethod
+    def bulk_create(klass, items, max_workers=10):
+        """
+        Create an object for each dict of items, sending at most max_workers
+        requests at a time
+
+        Returns a ParallelResult mapping the index of each item to the created
+        object, failed items being reported in its `errors`
+
+        """
+        items = list(items)
+        return run_parallel(lambda i: klass.create(**items[i]), range(len(items)), max_workers)
+
+
+    @classmethod
+    def bulk_update(klass, objects, max_workers=10):
+        """
+        Save each object of objects, sending at most max_workers requests at a
+        time
+
+        Returns a ParallelResult mapping the index of each object to the
+        updated object, failed updates being reported in its `errors`
+
+        """
+        objects = list(objects)
+        return run_parallel(lambda i: klass._bulk_update_one(objects[i]), range(len(objects)), max_workers)
+
+
+    @classmethod
+    def bulk_delete(klass, objects, max_workers=10):
+        """
+        Delete each object (or id) of objects, sending at most max_workers
+        requests at a time
+
+        Returns a ParallelResult mapping the index of each object to the
+        deleted object, failed deletions being reported in its `errors`
+
+        """
+        objects = [obj if isinstance(obj, JsonObject) else klass(id=obj) for obj in objects]
+        return run_parallel(lambda i: klass._bulk_delete_one(objects[i]), range(len(objects)), max_workers)
+
+
+    @classmethod
+    def _bulk_update_one(klass, obj):
+        obj.update()
+        return obj
+
+
+    @classmethod
+    def _bulk_delete_one(klass, obj):
+        obj.delete()
+        return obj
+
+
+    @contextmanager
+    def batch(self):
+        """
+        A context in which updates of the object, including the ones triggered
+        by its nested objects, are deferred and sent as a single PUT when the
+        outermost batch exits without error
+
+        """
+        self._enter_batch()
+        try:
+            yield self
+        except Exception:
+            self._exit_batch(False)
+            raise
+        if self._exit_batch(True):
+            self.update()
+
+
+    def _enter_batch(self):
+        self._batch_depth = getattr(self, '_batch_depth', 0) + 1
+
+
+    def _exit_batch(self, flush):
+        """
+        Leave a batch, returns True if it was the outermost one, flush is set
+        and an update is pending
+
+        """
+        self._batch_depth -= 1
+        if self._batch_depth:
+            return False
+        pending = getattr(self, '_batch_pending', False)
+        self._batch_pending = False
+        return flush and pending
+
+
+    def _defer_update(self):
+        """
+        Returns True if the object is in a batch, marking its update as pending
+
+        """
+        if getattr(self, '_batch_depth', 0):
+            self._batch_pending = True
+            return True
+        return False
+
+
     def update(self, **kwargs):
-        r = self.quanta._put(self.get_route(self.id), data={self.DICT_KEY: self.as_dict()})
+        """
+        Save the object, only sending the attributes and nested objects
+        modified since it was loaded; nothing is sent if none were
+
+        """
+        if self._defer_update():
+            return
+        data = self.changes_as_dict()
+        if not data:
+            return
+        r = self.quanta._put(self.get_route(self.id), data={self.DICT_KEY: data})
         self.from_dict(**r[self.DICT_KEY])
+        self._mark_clean()
+        self._reindex(self)
 
 
     def delete(self):
         r = self.quanta._delete(self.get_route(self.id))
         if hasattr(self, 'id'):
+            self._reindex(self, deleted_id=self.id)
             self.id = None
 
 
 
-class NestedObject(JsonObject):
+class LazyObject(object):
     """
-    This class represents a 'nestable' object to include in a top-level resource
+    The mixin of the stubs built by `BaseObject._load_lazy`
+
+    A stub keeps the dict it was built from in `_raw` and decodes an attribute
+    or a list of nested objects into its slot the first time it is read, so
+    that reading the ids and names of a large listing does not build every
+    nested object. Assigned attributes are never overwritten by the payload.
 
     """
-    @classmethod
-    def nest_in(klass, name, _resource):
-        class _NestedObject(klass):
-            resource = _resource
-            nested_name = name
-        return _NestedObject
+    __slots__ = ()
 
-    @classmethod
-    def create(klass, **kwargs):
-        getattr(klass.resource, klass.nested_name).append(klass(**kwargs))
-        klass.resource.update()
+    @staticmethod
+    def subclass(klass):
+        """
+        Returns the stub class of the resource klass
+
+        """
+        fields = {attr.name: attr for attr in klass.ATTRS}
+        fields.update({_pluralize(nested): nested_klass
+                       for nested, nested_klass in klass.NESTED_RESOURCES.items()})
+        return type(klass)('Lazy' + klass.__name__, (LazyObject, klass), {
+            '__slots__': ('_raw', '_full'),
+            '__module__': klass.__module__,
+            '_LAZY_FIELDS': fields,
+        })
+
+
+    def __getattr__(self, name):
+        """
+        Decode name from the payload on first access
+
+        """
+        if name == '_clean':
+            return self._decode_clean()
+        field = self._LAZY_FIELDS.get(name)
+        if field is None or self._raw is None:
+            raise AttributeError(name)
+        if isinstance(field, Attribute):
+            value = self._raw_value(name)
+            if value is None:
+                value = field.default
+            if value is None:
+                raise AttributeError(name)
+        else:
+            factory = NestedFactory(field, self, name)
+            value = [factory(**data) for data in self._raw_value(name) or ()]
+            for item in value:
+                item._mark_clean()
+        setattr(self, name, value)
+        return value
+
+
+    def _raw_value(self, name):
+        """
+        Returns the value of name in the payload, fetching the whole object if
+        the payload lacks it
+
+        """
+        if name not in self._raw and not self._full and not name.startswith('_'):
+            self._fetch_missing(name)
+        return self._raw.get(name)
+
+
+    def _decode_clean(self):
+        """
+        The values known by the API are the ones of the payload, whatever was
+        assigned since
+
+        """
+        if self._raw is None:
+            raise AttributeError('_clean')
+        clean = []
+        for attr in self._get_attrs():
+            value = self._raw_value(attr.name)
+            clean.append(attr.default if value is None else value)
+        self._clean = tuple(clean)
+        return self._clean
+
+
+    def _merge_raw(self, data):
+        """
+        Complete the payload with data, the full representation of the object
+
+        """
+        raw = dict(self._raw)
+        raw.update(data)
+        self._raw = raw
+        self._full = True
+
+
+    def from_dict(self, **kwargs):
+        """
+        Build the object from kwargs, which replace the payload
+
+        """
+        super(LazyObject, self).from_dict(**kwargs)
+        self._raw = None
 
 
+
+class NestedObject(JsonObject):
+    """
+    This class represents a 'nestable' object to include in a top-level resource
+
+    Nested objects reference their parent resource in `resource` and the list
+    they belong to in `nested_name`
+
+    """
+    SLOTS = ('_destroy', 'resource', 'nested_name')
+
     def delete(self):
         self._destroy = True
-        self.resource.update()
+        return self.resource.update()
 
 
     def update(self, **kwargs):
-        self.resource.update()
+        return self.resource.update()
+
+
+
+class NestedFactory(object):
+    """
+    Builds the nested objects of a resource: `scenario.Step(**kwargs)` returns a
+    step of scenario and `scenario.Step.create(**kwargs)` adds it and saves
+    the scenario
+
+    """
+    __slots__ = ('klass', 'resource', 'nested_name')
+
+    def __init__(self, klass, resource, nested_name):
+        self.klass = klass
+        self.resource = resource
+        self.nested_name = nested_name
+
+
+    def __call__(self, **kwargs):
+        obj = self.klass(**kwargs)
+        obj.resource = self.resource
+        obj.nested_name = self.nested_name
+        return obj
+
+
+    def __instancecheck__(self, obj):
+        return isinstance(obj, self.klass) and getattr(obj, 'resource', None) is self.resource
+
+
+    def create(self, **kwargs):
+        getattr(self.resource, self.nested_name).append(self(**kwargs))
+        return self.resource.update()
+
+
+
+class NestedResource(object):
+    """
+    A descriptor returning the NestedFactory of a nested resource when accessed
+    on an instance, and the nested class when accessed on the class
+
+    """
+
+    def __init__(self, klass, nested_name):
+        self.klass = klass
+        self.nested_name = nested_name
+
+
+    def __get__(self, obj, owner):
+        if obj is None:
+            return self.klass
+        return NestedFactory(self.klass, obj, self.nested_name)
 
 
 
@@ -242,14 +852,19 @@ class SingleObject(APIObject):
 
     @classmethod
     def get(klass):
-        r = klass.quanta._get(klass.get_route())
-        return klass(**r[klass.DICT_KEY])
+        r = klass.quanta._get(klass.get_route(), ttl=klass.CACHE_TTL)
+        return klass._load(r[klass.DICT_KEY])
 
     def update(self, **kwargs):
+        data = self.changes_as_dict()
+        if not data:
+            return self
         try:
-            r = self.quanta._put(self.get_route(), data={self.DICT_KEY: self.as_dict()})
+            r = self.quanta._put(self.get_route(), data={self.DICT_KEY: data})
             self.from_dict(**r[self.DICT_KEY])
+            self._mark_clean()
         except APIError as e:
-            self.from_dict(self.get(self.id).as_dict())
+            self.from_dict(**self.get().as_dict())
+            self._mark_clean()
             raise e
         return self
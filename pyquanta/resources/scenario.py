@@ -10,6 +10,7 @@ class Step(NestedObject):
     This class represents a scenario step
 
     """
+    SYNC_KEY = 'no'
     ATTRS = [
         Attribute('id', required=False),
         Attribute('name'),
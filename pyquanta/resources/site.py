@@ -12,7 +12,7 @@ class Site(BaseObject):
     """
     BASE_ROUTE = '/sites'
     ATTRS = [
-        Attribute('id'),
+        Attribute('id', required=False),
         Attribute('name'),
         Attribute('role', required=False),
     ]
@@ -0,0 +1,164 @@
+"""
+This module contains the request scheduler: rate limiting and retries with
+exponential backoff
+
+"""
+import random
+import threading
+import time
+
+
+class TokenBucket(object):
+    """
+    A token bucket allowing rate requests per second on average with bursts of
+    at most burst requests
+
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+
+    def reserve(self):
+        """
+        Take a token and return the number of seconds to wait before using it
+
+        """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+
+class RetryPolicy(object):
+    """
+    Decides which failed requests are retried and how long to wait before
+
+    Requests failing with a connection error or one of statuses are retried up
+    to max_retries times if their method is in methods. 429 responses are
+    retried whatever the method as the server did not process the request.
+    Delays grow exponentially from backoff up to max_backoff, with full jitter,
+    unless the server sent a Retry-After header.
+
+    """
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE')
+
+    def __init__(self, max_retries=3, backoff=0.5, max_backoff=30, jitter=True,
+                 statuses=(429, 502, 503, 504), methods=IDEMPOTENT_METHODS, retry_post=False):
+        """
+        Initialize the policy, retry_post allowing to retry POST requests too
+
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = frozenset(statuses)
+        self.methods = frozenset(methods) | (frozenset(['POST']) if retry_post else frozenset())
+
+
+    def delay(self, method, attempt, status=None, headers=None):
+        """
+        Returns the number of seconds to wait before retrying a request sent
+        attempt times before, or None if it must not be retried
+
+        status is None if the request failed with a connection error
+
+        """
+        if attempt >= self.max_retries:
+            return None
+        if status is not None and status not in self.statuses:
+            return None
+        if method not in self.methods and status != 429:
+            return None
+        retry_after = self._retry_after(headers)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+
+    def _retry_after(self, headers):
+        """
+        Returns the delay requested by the Retry-After header, if any
+
+        """
+        value = headers.get('Retry-After') if headers is not None else None
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        from email.utils import parsedate_to_datetime
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+
+
+class Scheduler(object):
+    """
+    Schedules requests of a Quanta client: it throttles them with an optional
+    token bucket and retries failures according to a RetryPolicy
+
+    """
+
+    def __init__(self, rate_limit=None, burst=None, retry=None):
+        """
+        Initialize the scheduler, rate_limit being the maximum number of
+        requests per second (no limit if None) and retry the RetryPolicy (no
+        retries if None)
+
+        """
+        self.bucket = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.retry = retry
+        self.throttled = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+
+    def reserve(self):
+        """
+        Returns the number of seconds to wait before sending a request
+
+        """
+        if self.bucket is None:
+            return 0.0
+        delay = self.bucket.reserve()
+        if delay > 0:
+            with self._lock:
+                self.throttled += 1
+        return delay
+
+
+    def retry_delay(self, method, attempt, status=None, headers=None):
+        """
+        Returns the number of seconds to wait before retrying a failed request
+        or None if it must not be retried
+
+        """
+        if self.retry is None:
+            return None
+        delay = self.retry.delay(method, attempt, status, headers)
+        if delay is not None:
+            with self._lock:
+                self.retries += 1
+        return delay
+
+
+    @property
+    def stats(self):
+        return {'throttled': self.throttled, 'retries': self.retries}
@@ -0,0 +1,83 @@
+"""
+This module contains the stores used to persist authenticated sessions between
+runs, so that short-lived processes can skip the login handshake
+
+A store is any object with `load()`, returning the saved state or None,
+`save(state)` and `clear()` methods, the state being a JSON-serializable dict.
+
+"""
+import json
+import os
+import tempfile
+
+
+class FileSessionStore(object):
+    """
+    Saves the session state to a JSON file only readable by its owner
+
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+
+
+    def load(self):
+        """
+        Returns the saved state or None if there is none or it is unreadable
+
+        """
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+
+    def save(self, state):
+        """
+        Atomically replace the saved state with state, the file being created
+        with 0600 permissions by mkstemp
+
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.pyquanta-session-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp, self.path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+
+    def clear(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+
+class MemorySessionStore(object):
+    """
+    Keeps the session state in memory, e.g. to share it between clients of the
+    same process
+
+    """
+
+    def __init__(self):
+        self.state = None
+
+
+    def load(self):
+        return self.state
+
+
+    def save(self, state):
+        self.state = state
+
+
+    def clear(self):
+        self.state = None
@@ -0,0 +1,119 @@
+"""
+This module contains the single-flight groups used to coalesce concurrent
+identical GET requests into one
+
+"""
+import threading
+
+# Result of an async call whose leader was cancelled, its followers retrying it
+_ABANDONED = object()
+
+
+class _Call(object):
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+
+class SingleFlight(object):
+    """
+    Runs at most one call per key at a time across threads: callers arriving
+    while a call for their key is in flight wait for it and share its result
+
+    """
+
+    def __init__(self):
+        self.executed = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+
+    def do(self, key, fn):
+        """
+        Returns (fn(), shared), shared being True if the result of a call made
+        by another caller was reused. Exceptions are shared too.
+
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+    @property
+    def stats(self):
+        """
+        Returns the number of calls executed and of calls coalesced into them
+
+        """
+        return {'executed': self.executed, 'coalesced': self.coalesced}
+
+
+
+class AsyncSingleFlight(SingleFlight):
+    """
+    Runs at most one call per key at a time on the event loop: coroutines
+    awaiting a key already in flight share the result of the first one
+
+    """
+
+    async def do(self, key, fn):
+        """
+        Returns (await fn(), shared), shared being True if the result of a call
+        made by another task was reused. Exceptions are shared too.
+
+        If the task making the call is cancelled, the tasks waiting for it are
+        not: one of them makes the call again.
+
+        """
+        import asyncio
+
+        future = self._calls.get(key)
+        while future is not None:
+            self.coalesced += 1
+            result = await asyncio.shield(future)
+            if result is not _ABANDONED:
+                return result, True
+            self.coalesced -= 1
+            future = self._calls.get(key)
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        self.executed += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.set_result(_ABANDONED)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Retrieve the exception so that it is not reported if nobody waits
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._calls[key]
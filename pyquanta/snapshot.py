@@ -0,0 +1,148 @@
+"""
+This module contains the on-disk snapshot store, keeping GET responses between
+runs so that reads can be served locally
+
+"""
+import json
+import os
+import threading
+import time
+
+
+class SnapshotStore(object):
+    """
+    A SQLite store of parsed GET responses keyed by URL, with the time they
+    were fetched
+
+    Snapshots younger than max_age seconds are served as is. Older ones are
+    still served while younger than max_stale seconds, the client refreshing
+    them in the background, and fetched again otherwise. A store should only be
+    shared by clients logged in with the same account.
+
+    """
+
+    def __init__(self, path, max_age=300, max_stale=7 * 24 * 3600):
+        """
+        Initialize the store in the SQLite database at path, created if needed
+
+        """
+        import sqlite3
+
+        self.path = path
+        self.max_age = max_age
+        self.max_stale = max_stale
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS snapshots '
+            '(key TEXT PRIMARY KEY, response TEXT NOT NULL, fetched_at REAL NOT NULL)'
+        )
+
+
+    def get(self, key):
+        """
+        Returns the (response, age) snapshot of key, or None if there is none
+        or it is older than max_stale
+
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT response, fetched_at FROM snapshots WHERE key = ?', (key,)
+            ).fetchone()
+            age = time.time() - row[1] if row is not None else None
+            if row is None or age > self.max_stale:
+                self.misses += 1
+                return None
+            if age > self.max_age:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+        return json.loads(row[0]), age
+
+
+    def is_stale(self, age):
+        return age > self.max_age
+
+
+    def set(self, key, response):
+        """
+        Save response as the snapshot of key
+
+        """
+        data = json.dumps(response)
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO snapshots (key, response, fetched_at) VALUES (?, ?, ?)',
+                (key, data, time.time()),
+            )
+
+
+    def invalidate(self, key):
+        """
+        Drop the snapshots of key, the keys below it and the collection key it
+        belongs to
+
+        """
+        parent = key.rsplit('/', 1)[0]
+        prefix = key + '/'
+        with self._lock:
+            self._db.execute(
+                'DELETE FROM snapshots WHERE key = ? OR key = ? OR substr(key, 1, ?) = ?',
+                (key, parent, len(prefix), prefix),
+            )
+
+
+    def clear(self):
+        """
+        Drop every snapshot
+
+        """
+        with self._lock:
+            self._db.execute('DELETE FROM snapshots')
+
+
+    def begin_refresh(self, key):
+        """
+        Returns True if the caller should refresh key, False if a refresh of
+        key is already running
+
+        """
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+
+    def end_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+    @property
+    def stats(self):
+        """
+        Returns hit/miss counters and the number of snapshots
+
+        """
+        with self._lock:
+            entries = self._db.execute('SELECT COUNT(*) FROM snapshots').fetchone()[0]
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'entries': entries,
+        }
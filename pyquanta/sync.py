@@ -0,0 +1,270 @@
+"""
+This module contains a declarative sync engine: it compares a desired state with
+the resources in the API and only sends the calls needed to reconcile them
+
+    plan = sync.plan(quanta.servers, [{'name': 'web1', 'role': 'web', 'host': 'web1'}])
+    print(plan)
+    plan.apply()
+
+"""
+from .parallel import run_parallel
+
+
+class Change(object):
+    """
+    A change on a resource: creation, update or deletion
+
+    """
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    SYMBOLS = {CREATE: '+', UPDATE: '~', DELETE: '-'}
+
+
+    def __init__(self, action, key, current=None, desired=None, fields=None, nested=None):
+        """
+        Initialize a change on the resource identified by key, current being
+        the object in the API and desired the desired attributes
+
+        fields maps changed attributes to their (current, desired) values and
+        nested maps nested resources names to their change counts
+
+        """
+        self.action = action
+        self.key = key
+        self.current = current
+        self.desired = desired
+        self.fields = fields or {}
+        self.nested = nested or {}
+
+
+    def __str__(self):
+        line = '{} {}'.format(self.SYMBOLS[self.action], self.key)
+        details = ['{}: {!r} -> {!r}'.format(name, old, new)
+                   for name, (old, new) in sorted(self.fields.items())]
+        details += ['{}: {}'.format(name, ', '.join(
+                        '{} {}'.format(count, action) for action, count in sorted(counts.items()) if count))
+                    for name, counts in sorted(self.nested.items())]
+        if details:
+            line += ' ({})'.format('; '.join(details))
+        return line
+
+
+
+class Plan(object):
+    """
+    The list of changes needed to reach a desired state for a resource class
+
+    """
+
+    def __init__(self, klass, changes):
+        self.klass = klass
+        self.changes = changes
+        self.result = None
+
+
+    def _changes(self, action):
+        return [change for change in self.changes if change.action == action]
+
+
+    @property
+    def creates(self):
+        return self._changes(Change.CREATE)
+
+
+    @property
+    def updates(self):
+        return self._changes(Change.UPDATE)
+
+
+    @property
+    def deletes(self):
+        return self._changes(Change.DELETE)
+
+
+    def __bool__(self):
+        return bool(self.changes)
+
+
+    def __str__(self):
+        if not self.changes:
+            return 'No changes'
+        return '\n'.join(str(change) for change in self.changes)
+
+
+    def apply(self, max_workers=10):
+        """
+        Send the changes to the API, at most max_workers at a time
+
+        Returns a ParallelResult mapping the key of each change to the created,
+        updated or deleted object, failed changes being reported in its
+        `errors`
+
+        """
+        changes = {change.key: change for change in self.changes}
+        if len(changes) != len(self.changes):
+            raise ValueError('Several changes of the plan have the same key')
+        return run_parallel(lambda key: self._apply_change(changes[key]), changes, max_workers)
+
+
+    def _apply_change(self, change):
+        if change.action == Change.CREATE:
+            return self.klass.create(**change.desired)
+        obj = change.current
+        if change.action == Change.DELETE:
+            obj.delete()
+            return obj
+        for name, (old, new) in change.fields.items():
+            setattr(obj, name, new)
+        for name in obj._get_nested_resources():
+            plural = obj._pluralize(name)
+            if plural in change.nested:
+                setattr(obj, plural, _sync_nested(obj, name, change.desired.get(plural, [])))
+        obj.update()
+        return obj
+
+
+
+def _key(obj_or_dict, key):
+    if isinstance(obj_or_dict, dict):
+        return obj_or_dict.get(key)
+    return getattr(obj_or_dict, key, None)
+
+
+def _diff_attrs(current, desired):
+    """
+    Returns the attributes of the desired dict differing from current as a
+    dict of (current, desired) values
+
+    Only the attributes present in desired are compared: the ones it omits
+    are left as they are rather than reset to their defaults
+
+    """
+    fields = {}
+    for attr in current._get_attrs():
+        if attr.name in ('id', '_destroy'):
+            continue
+        value = desired.get(attr.name)
+        if value is None:
+            continue
+        old = getattr(current, attr.name, attr.default)
+        if old != value:
+            fields[attr.name] = (old, value)
+    return fields
+
+
+def _check_unique(desired, key):
+    """
+    Raise a ValueError if several dicts of desired have the same key
+
+    """
+    seen = set()
+    for data in desired:
+        name = _key(data, key)
+        if name in seen:
+            raise ValueError('Several desired objects have {} {!r}'.format(key, name))
+        seen.add(name)
+
+
+def _diff_nested(current, desired, name):
+    """
+    Returns the change counts between the nested resources name of current and
+    their desired attributes
+
+    """
+    klass = current._get_nested_resources()[name]
+    key = klass.SYNC_KEY
+    plural = current._pluralize(name)
+    existing = {_key(item, key): item for item in getattr(current, plural, [])}
+    counts = {Change.CREATE: 0, Change.UPDATE: 0, Change.DELETE: 0}
+    _check_unique(desired.get(plural, []), key)
+    for data in desired.get(plural, []):
+        item = existing.pop(_key(data, key), None)
+        if item is None:
+            klass(**data).as_dict()
+            counts[Change.CREATE] += 1
+        elif _diff_attrs(item, data):
+            counts[Change.UPDATE] += 1
+    counts[Change.DELETE] = len(existing)
+    return counts
+
+
+def _sync_nested(obj, name, desired):
+    """
+    Returns the nested resources name of obj updated to their desired
+    attributes, the ones not desired anymore being marked for destruction
+
+    """
+    factory = getattr(obj, name.capitalize())
+    key = factory.klass.SYNC_KEY
+    existing = {_key(item, key): item for item in getattr(obj, obj._pluralize(name), [])}
+    items = []
+    for data in desired:
+        item = existing.pop(_key(data, key), None)
+        if item is None:
+            items.append(factory(**data))
+        else:
+            for attr, (old, new) in _diff_attrs(item, data).items():
+                setattr(item, attr, new)
+            items.append(item)
+    for item in existing.values():
+        item._destroy = True
+        items.append(item)
+    return items
+
+
+def plan(klass, desired, key=None, delete=False, current=None):
+    """
+    Compute the changes needed for the objects of klass to match desired, a
+    list of attribute dicts matched to existing objects by their key attribute
+    (klass.SYNC_KEY if None)
+
+    Objects missing from desired are deleted only if delete is set. current is
+    the list of existing objects, fetched with klass.list() if None. Existing
+    objects only have the attributes given in desired compared, defaults only
+    apply to the objects created.
+
+    A ValueError is raised if several dicts of desired have the same key.
+
+    """
+    if key is None:
+        key = klass.SYNC_KEY
+    desired = list(desired)
+    _check_unique(desired, key)
+    if current is None:
+        current = klass.list()
+    existing = {_key(obj, key): obj for obj in current}
+    changes = []
+    for data in desired:
+        name = _key(data, key)
+        obj = existing.pop(name, None)
+        if obj is None:
+            # Fail before sending anything if required attributes are missing
+            klass(**data).as_dict()
+            changes.append(Change(Change.CREATE, name, desired=data))
+            continue
+        fields = _diff_attrs(obj, data)
+        nested = {}
+        for nested_name in obj._get_nested_resources():
+            plural = obj._pluralize(nested_name)
+            if plural in data:
+                counts = _diff_nested(obj, data, nested_name)
+                if any(counts.values()):
+                    nested[plural] = counts
+        if fields or nested:
+            changes.append(Change(Change.UPDATE, name, obj, data, fields, nested))
+    if delete:
+        changes.extend(Change(Change.DELETE, name, obj) for name, obj in existing.items())
+    return Plan(klass, changes)
+
+
+def sync(klass, desired, key=None, delete=False, dry_run=False, max_workers=10):
+    """
+    Make the objects of klass match desired (see `plan`) and return the plan,
+    its changes being applied unless dry_run is set
+
+    """
+    p = plan(klass, desired, key, delete)
+    if not dry_run and p:
+        p.result = p.apply(max_workers)
+    return p
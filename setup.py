@@ -37,7 +37,6 @@ setup(name='pyquanta',
           'Development Status :: 4 - Beta',
           'Programming Language :: Python',
           'Programming Language :: Python :: 3',
-          'Programming Language :: Python :: 2',
           'Intended Audience :: Developers',
           'Intended Audience :: System Administrators',
           'Operating System :: OS Independent',
@@ -48,4 +47,16 @@ setup(name='pyquanta',
       ],
       packages=find_packages(),
       install_requires=requirements(),
+      entry_points={
+          'console_scripts': [
+              'pyquanta = pyquanta.cli:main',
+              'pyquanta-export = pyquanta.export:main',
+          ],
+      },
+      extras_require={
+          'async': ['aiohttp'],
+          'stream': ['ijson'],
+          'fast': ['orjson'],
+          'yaml': ['PyYAML'],
+      },
   )